@@ -4,8 +4,14 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # Suppress TF logs (0=all, 1=info, 2=warning, 3=error)
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # Disable oneDNN warnings
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, Request, render_template, request, jsonify, redirect, url_for, session, flash, Response, stream_with_context
 from functools import wraps
+import atexit
+import base64
+import csv
+import io
+import json
+import tempfile
 from pathlib import Path
 import numpy as np
 from werkzeug.utils import secure_filename
@@ -26,19 +32,62 @@ def lazy_load_model(path):
         print(f'Error loading model from {path}: {e}')
         return None
 
-from ml_utils import clean_text, clean_url, load_tokenizer, texts_to_sequences
+from ml_utils import (TFLiteModel, clean_text, clean_url, clean_urls, length_aware_model, load_tokenizer,
+                      score_long_documents, texts_to_sequences, window_token_budget)
+from linear_tier import LinearTier
 from openrouter_verifier import verify_with_openrouter
-from file_extractor import extract_text_from_file
+from extraction_cache import ExtractionCache
+from extraction_jobs import ExtractionJobs, JobRejected
+from history_maintenance import HistoryMaintenance
+from history_writer import HistoryWriter
+from request_coalescing import SingleFlight, normalize_content
+from runtime_metrics import incr, snapshot as runtime_snapshot
+from file_extractor import extract_links, extract_text_from_file, extract_text_for_classification
 from database import (
-    create_user, verify_user, get_user_by_id, 
-    save_search, get_user_history, get_user_stats,
+    create_user, verify_user, get_user_by_id, invalidate_user,
+    get_user_history, get_user_history_page, iter_user_history, get_user_stats,
     delete_history_item, clear_user_history
 )
 
+class UploadRequest(Request):
+    """Keep uploads in memory up to UPLOAD_SPOOL_THRESHOLD, spool larger ones to UPLOAD_DIR"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_THRESHOLD'], dir=UPLOAD_DIR)
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['SECRET_KEY'] = 'spam-detection-system-2025-secure-key'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_SPOOL_THRESHOLD'] = 2 * 1024 * 1024  # larger uploads are spooled to disk
+# Tokens extracted when an upload is only being classified; None = what the email model scores
+# (the first 150 tokens, or EMAIL_MAX_WINDOWS windows of them with window pooling)
+app.config['CLASSIFY_TOKEN_BUDGET'] = None
+# Email/SMS LSTM and URL CNN serving: 'off', 'trim', 'mask' or 'auto' (see ml_utils.length_aware_model)
+app.config['SEQUENCE_MODE'] = 'auto'
+# Long emails: score overlapping 150-token windows instead of only the first 150 tokens
+app.config['EMAIL_WINDOW_POOLING'] = 'max'     # 'max', 'attention', or None for first-window only
+app.config['EMAIL_MAX_WINDOWS'] = 8            # caps the cost of very long emails
+# Email/SMS: a hashed n-gram linear model decides confident inputs before the LSTM runs
+app.config['LINEAR_TIER'] = True
+# URLs: a lexical-feature gradient-boosting model decides confident URLs before the CNN runs
+app.config['URL_FEATURES'] = True
+# Serve the int8 dynamic-range TFLite model (models/<name>_model.tflite) when training kept one
+# (only kept if as accurate and at least as fast per request, see quantization.py)
+app.config['QUANTIZED_MODELS'] = True
+
+# Write-behind search history (see history_writer.HistoryWriter)
+app.config['HISTORY_QUEUE_SIZE'] = 10000       # max rows waiting to be written
+app.config['HISTORY_BATCH_SIZE'] = 200         # rows per INSERT transaction
+app.config['HISTORY_FLUSH_INTERVAL'] = 0.5     # seconds before a partial batch is written
+app.config['HISTORY_QUEUE_FULL'] = 'block'     # 'block', 'drop' or 'sync' when the queue is full
+# History retention (see history_maintenance.HistoryMaintenance)
+app.config['HISTORY_RETENTION_DAYS'] = 90      # older rows move to monthly archive tables; None disables
+app.config['HISTORY_MAINTENANCE_INTERVAL'] = 3600  # seconds between archive + vacuum runs
+# Background extraction jobs (see extraction_jobs.ExtractionJobs)
+app.config['EXTRACTION_JOB_WORKERS'] = 2            # extractions running at once
+app.config['EXTRACTION_JOB_TIME_LIMIT'] = 300       # seconds per job
+app.config['EXTRACTION_JOB_MEMORY_LIMIT'] = 2 * 1024 ** 3  # bytes of address space per job
 
 # Error handler for file too large
 @app.errorhandler(413)
@@ -64,10 +113,15 @@ def get_current_user():
         return get_user_by_id(session['user_id'])
     return None
 
+# Multiprocessing children (the OCR pool) re-import this module as __mp_main__;
+# only the serving process registers the background services' shutdown hooks
+SERVING = __name__ != '__mp_main__'
+
 BASE = Path(__file__).resolve().parent
 MODELS_DIR = BASE / 'models'
 UPLOAD_DIR = BASE / 'uploads'
 UPLOAD_DIR.mkdir(exist_ok=True)
+URL_BATCH_SIZE = 128  # links per URL model batch when scanning uploads
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'pdf', 'docx', 'doc', 'txt', 'eml'}
 
@@ -79,8 +133,48 @@ email_model = None
 email_tokenizer = None
 sms_model = None
 sms_tokenizer = None
+email_linear = None  # linear first tiers (see linear_tier.LinearTier)
+sms_linear = None
 url_model = None
 url_tokenizer = None
+url_feature_tier = None  # lexical fast stage (see url_features)
+
+history_writer = HistoryWriter(
+    max_queue=app.config['HISTORY_QUEUE_SIZE'],
+    batch_size=app.config['HISTORY_BATCH_SIZE'],
+    flush_interval=app.config['HISTORY_FLUSH_INTERVAL'],
+    on_full=app.config['HISTORY_QUEUE_FULL']
+)
+# Write out anything still queued when the process exits
+if SERVING:
+    atexit.register(history_writer.stop)
+
+history_maintenance = HistoryMaintenance(
+    retention_days=app.config['HISTORY_RETENTION_DAYS'],
+    interval=app.config['HISTORY_MAINTENANCE_INTERVAL']
+)
+
+@app.before_request
+def start_background_jobs():
+    """Start retention maintenance in whichever process serves requests"""
+    history_maintenance.start()
+
+# Extracted text of previously seen uploads, keyed by content hash
+extraction_cache = ExtractionCache()
+
+# Large extractions run as jobs outside the request (see /api/jobs/extract)
+extraction_jobs = ExtractionJobs(
+    UPLOAD_DIR / 'jobs',
+    workers=app.config['EXTRACTION_JOB_WORKERS'],
+    time_limit=app.config['EXTRACTION_JOB_TIME_LIMIT'],
+    memory_limit=app.config['EXTRACTION_JOB_MEMORY_LIMIT'],
+    cache=extraction_cache
+)
+if SERVING:
+    atexit.register(extraction_jobs.shutdown)
+
+# Identical predictions in flight at the same time share one model + AI run
+prediction_flight = SingleFlight('predict')
 
 # Model metrics (stored after training)
 model_metrics = {
@@ -89,37 +183,67 @@ model_metrics = {
     'url': {'accuracy': 0.0, 'precision': 0.0, 'recall': 0.0, 'f1': 0.0}
 }
 
+def load_serving_model(path):
+    """The quantized TFLite model saved next to a Keras model if enabled and present, else the Keras model"""
+    quantized = Path(path).with_suffix('.tflite')
+    if app.config['QUANTIZED_MODELS'] and quantized.exists():
+        try:
+            model = TFLiteModel(quantized)
+            print(f'✓ Using quantized model {quantized.name}')
+            return model
+        except Exception as e:
+            print(f'Error loading quantized model from {quantized}: {e}')
+    return lazy_load_model(path)
+
 def load_models():
     """Load all trained models and tokenizers"""
     global email_model, email_tokenizer, sms_model, sms_tokenizer, url_model, url_tokenizer
+    global email_linear, sms_linear, url_feature_tier
     
     try:
         # Load Email model
         email_model_path = MODELS_DIR / 'email_model.h5'
         email_tok_path = MODELS_DIR / 'tokenizer_email.pkl'
         if email_model_path.exists() and email_tok_path.exists():
-            email_model = lazy_load_model(email_model_path)
+            email_model = load_serving_model(email_model_path)
             email_tokenizer = load_tokenizer(str(email_tok_path))
             if email_model:
+                email_model = length_aware_model(email_model, app.config['SEQUENCE_MODE'])
                 print('✓ Email model loaded')
+        email_linear_path = MODELS_DIR / 'email_linear.joblib'
+        if app.config['LINEAR_TIER'] and email_linear_path.exists():
+            email_linear = LinearTier.load(str(email_linear_path))
+            print('✓ Email linear tier loaded')
         
         # Load SMS model
         sms_model_path = MODELS_DIR / 'sms_model.h5'
         sms_tok_path = MODELS_DIR / 'tokenizer_sms.pkl'
         if sms_model_path.exists() and sms_tok_path.exists():
-            sms_model = lazy_load_model(sms_model_path)
+            sms_model = load_serving_model(sms_model_path)
             sms_tokenizer = load_tokenizer(str(sms_tok_path))
             if sms_model:
+                sms_model = length_aware_model(sms_model, app.config['SEQUENCE_MODE'])
                 print('✓ SMS model loaded')
+        sms_linear_path = MODELS_DIR / 'sms_linear.joblib'
+        if app.config['LINEAR_TIER'] and sms_linear_path.exists():
+            sms_linear = LinearTier.load(str(sms_linear_path))
+            print('✓ SMS linear tier loaded')
         
         # Load URL model
         url_model_path = MODELS_DIR / 'url_model.h5'
         url_tok_path = MODELS_DIR / 'tokenizer_url.pkl'
         if url_model_path.exists() and url_tok_path.exists():
-            url_model = lazy_load_model(url_model_path)
+            url_model = load_serving_model(url_model_path)
             url_tokenizer = load_tokenizer(str(url_tok_path))
             if url_model:
+                # Masking is for the recurrent models; the CNN is only trimmed (to its kernel size at least)
+                url_mode = 'trim' if app.config['SEQUENCE_MODE'] == 'mask' else app.config['SEQUENCE_MODE']
+                url_model = length_aware_model(url_model, url_mode, min_length=3)
                 print('✓ URL model loaded')
+        url_features_path = MODELS_DIR / 'url_features.joblib'
+        if app.config['URL_FEATURES'] and url_features_path.exists():
+            url_feature_tier = LinearTier.load(str(url_features_path))
+            print('✓ URL feature model loaded')
         
     except Exception as e:
         print(f'Error loading models: {e}')
@@ -197,6 +321,8 @@ def signup():
 @app.route('/logout')
 def logout():
     """Logout user"""
+    if 'user_id' in session:
+        invalidate_user(session['user_id'])
     session.clear()
     flash('You have been logged out', 'success')
     return redirect(url_for('login'))
@@ -243,12 +369,82 @@ def stats_page():
 def history_page():
     """User search history page"""
     user = get_current_user()
+    # Make the user's most recent searches visible before reading
+    history_writer.flush()
     history = get_user_history(session['user_id'])
     stats = get_user_stats(session['user_id'])
     return render_template('history.html', user=user, history=history, stats=stats)
 
 # ========== API ROUTES ==========
 
+def first_tier(tier, value, metric):
+    """Probability from a fast first-tier model when it is confident, else None (run the neural model)"""
+    if tier is None:
+        return None
+    prob = tier.decide(value)
+    incr(f'{metric}.decided' if prob is not None else f'{metric}.deferred')
+    return prob
+
+def classify_email(text):
+    """Two-stage email classification (ML model + OpenRouter AI); returns the result dict"""
+    def run_pipeline():
+        # Preprocess
+        cleaned = clean_text(text)
+        
+        # Stage 1: Predict with ML model first (preliminary check);
+        # the linear tier answers confident cases without the LSTM
+        pred_prob, tier = first_tier(email_linear, cleaned, 'linear_tier.email'), 'linear'
+        if pred_prob is None:
+            tier = 'neural'
+            if app.config['EMAIL_WINDOW_POOLING']:
+                pred_prob = score_long_documents(email_model, email_tokenizer, [cleaned], maxlen=150,
+                                                 max_windows=app.config['EMAIL_MAX_WINDOWS'],
+                                                 pooling=app.config['EMAIL_WINDOW_POOLING'])[0]
+            else:
+                seq = texts_to_sequences(email_tokenizer, [cleaned], maxlen=150)
+                pred_prob = float(email_model.predict(seq, verbose=0)[0][0])
+        
+        # Stage 2: ALWAYS send to OpenRouter AI for final verification
+        return pred_prob, tier, verify_with_openrouter(text, content_type="email")
+    
+    # Concurrent identical requests (e.g. a spam blast) wait on one run
+    pred_prob, tier, ai_result = prediction_flight.do(normalize_content('email', text), run_pipeline)
+    model_says_spam = bool(pred_prob > 0.5)
+    model_spam_prob = pred_prob
+    ai_says_spam = ai_result['is_spam']
+    
+    # Final decision is based on AI result
+    if ai_says_spam:
+        result = {
+            'success': True,
+            'is_spam': True,
+            'confidence': ai_result['confidence'],
+            'label': 'Spam',
+            'type': 'email',
+            'verification': 'OpenRouter AI Verification',
+            'reason': ai_result.get('reason', 'Spam detected by AI'),
+            'stage': 'Final: AI Verified Spam',
+            'model_prediction': 'Spam' if model_says_spam else 'Legitimate',
+            'model_confidence': round(model_spam_prob * 100, 2),
+            'ai_confidence': ai_result['confidence']
+        }
+    else:
+        result = {
+            'success': True,
+            'is_spam': False,
+            'confidence': ai_result['confidence'],
+            'label': 'Legitimate',
+            'type': 'email',
+            'verification': 'OpenRouter AI Verification',
+            'reason': ai_result.get('reason', 'Content verified as legitimate'),
+            'stage': 'Final: AI Verified Legitimate',
+            'model_prediction': 'Spam' if model_says_spam else 'Legitimate',
+            'model_confidence': round((1 - model_spam_prob) * 100, 2) if not model_says_spam else round(model_spam_prob * 100, 2),
+            'ai_confidence': ai_result['confidence']
+        }
+    result['model_tier'] = tier
+    return result
+
 @app.route('/api/predict/email', methods=['POST'])
 def predict_email():
     """Predict email spam - Combined ML + AI approach for real-world detection"""
@@ -268,53 +464,12 @@ def predict_email():
                 'success': False
             }), 400
         
-        # Preprocess
-        cleaned = clean_text(text)
-        seq = texts_to_sequences(email_tokenizer, [cleaned], maxlen=150)
-        
-        # Stage 1: Predict with ML model first (preliminary check)
-        pred_prob = email_model.predict(seq, verbose=0)[0][0]
-        model_says_spam = bool(pred_prob > 0.5)
-        model_spam_prob = float(pred_prob)
-        
-        # Stage 2: ALWAYS send to OpenRouter AI for final verification
-        ai_result = verify_with_openrouter(text, content_type="email")
-        ai_says_spam = ai_result['is_spam']
-        
-        # Final decision is based on AI result
-        if ai_says_spam:
-            result = {
-                'success': True,
-                'is_spam': True,
-                'confidence': ai_result['confidence'],
-                'label': 'Spam',
-                'type': 'email',
-                'verification': 'OpenRouter AI Verification',
-                'reason': ai_result.get('reason', 'Spam detected by AI'),
-                'stage': 'Final: AI Verified Spam',
-                'model_prediction': 'Spam' if model_says_spam else 'Legitimate',
-                'model_confidence': round(model_spam_prob * 100, 2),
-                'ai_confidence': ai_result['confidence']
-            }
-        else:
-            result = {
-                'success': True,
-                'is_spam': False,
-                'confidence': ai_result['confidence'],
-                'label': 'Legitimate',
-                'type': 'email',
-                'verification': 'OpenRouter AI Verification',
-                'reason': ai_result.get('reason', 'Content verified as legitimate'),
-                'stage': 'Final: AI Verified Legitimate',
-                'model_prediction': 'Spam' if model_says_spam else 'Legitimate',
-                'model_confidence': round((1 - model_spam_prob) * 100, 2) if not model_says_spam else round(model_spam_prob * 100, 2),
-                'ai_confidence': ai_result['confidence']
-            }
+        result = classify_email(text)
         
         # Save to history if user is logged in
         if 'user_id' in session:
-            save_search(session['user_id'], 'email', text, result['label'],
-                       result['confidence'], result['verification'], result.get('reason'))
+            history_writer.submit(session['user_id'], 'email', text, result['label'],
+                                  result['confidence'], result['verification'], result.get('reason'))
         return jsonify(result)
         
     except Exception as e:
@@ -342,17 +497,25 @@ def predict_sms():
                 'success': False
             }), 400
         
-        # Preprocess
-        cleaned = clean_text(text)
-        seq = texts_to_sequences(sms_tokenizer, [cleaned], maxlen=100)
-        
-        # Stage 1: Predict with ML model first (preliminary check)
-        pred_prob = sms_model.predict(seq, verbose=0)[0][0]
+        def run_pipeline():
+            # Preprocess
+            cleaned = clean_text(text)
+            
+            # Stage 1: Predict with ML model first (preliminary check);
+            # the linear tier answers confident cases without the LSTM
+            pred_prob, tier = first_tier(sms_linear, cleaned, 'linear_tier.sms'), 'linear'
+            if pred_prob is None:
+                tier = 'neural'
+                seq = texts_to_sequences(sms_tokenizer, [cleaned], maxlen=100)
+                pred_prob = float(sms_model.predict(seq, verbose=0)[0][0])
+            
+            # Stage 2: ALWAYS send to OpenRouter AI for final verification
+            return pred_prob, tier, verify_with_openrouter(text, content_type="sms")
+        
+        # Concurrent identical requests (e.g. a spam blast) wait on one run
+        pred_prob, tier, ai_result = prediction_flight.do(normalize_content('sms', text), run_pipeline)
         model_says_spam = bool(pred_prob > 0.5)
-        model_spam_prob = float(pred_prob)
-        
-        # Stage 2: ALWAYS send to OpenRouter AI for final verification
-        ai_result = verify_with_openrouter(text, content_type="sms")
+        model_spam_prob = pred_prob
         ai_says_spam = ai_result['is_spam']
         
         # Final decision is based on AI result
@@ -384,10 +547,11 @@ def predict_sms():
                 'model_confidence': round((1 - model_spam_prob) * 100, 2) if not model_says_spam else round(model_spam_prob * 100, 2),
                 'ai_confidence': ai_result['confidence']
             }
+        result['model_tier'] = tier
         
         if 'user_id' in session:
-            save_search(session['user_id'], 'sms', text, result['label'],
-                       result['confidence'], result['verification'], result.get('reason'))
+            history_writer.submit(session['user_id'], 'sms', text, result['label'],
+                                  result['confidence'], result['verification'], result.get('reason'))
         return jsonify(result)
         
     except Exception as e:
@@ -415,17 +579,25 @@ def predict_url():
                 'success': False
             }), 400
         
-        # Preprocess
-        cleaned = clean_url(url_text)
-        seq = texts_to_sequences(url_tokenizer, [cleaned], maxlen=80)
-        
-        # Stage 1: Predict with ML model first (preliminary check)
-        pred_prob = url_model.predict(seq, verbose=0)[0][0]
+        def run_pipeline():
+            # Preprocess
+            cleaned = clean_url(url_text)
+            
+            # Stage 1: Predict with ML model first (preliminary check);
+            # lexical features of the raw URL answer confident cases without the CNN
+            pred_prob, tier = first_tier(url_feature_tier, url_text, 'url_features'), 'features'
+            if pred_prob is None:
+                tier = 'neural'
+                seq = texts_to_sequences(url_tokenizer, [cleaned], maxlen=80)
+                pred_prob = float(url_model.predict(seq, verbose=0)[0][0])
+            
+            # Stage 2: ALWAYS send to OpenRouter AI for final verification
+            return pred_prob, tier, verify_with_openrouter(url_text, content_type="url")
+        
+        # Concurrent identical requests (e.g. a spam blast) wait on one run
+        pred_prob, tier, ai_result = prediction_flight.do(normalize_content('url', url_text), run_pipeline)
         model_says_phishing = bool(pred_prob > 0.5)
-        model_phishing_prob = float(pred_prob)
-        
-        # Stage 2: ALWAYS send to OpenRouter AI for final verification
-        ai_result = verify_with_openrouter(url_text, content_type="url")
+        model_phishing_prob = pred_prob
         ai_says_phishing = ai_result['is_spam']
         
         # Final decision is based on AI result
@@ -457,10 +629,11 @@ def predict_url():
                 'model_confidence': round((1 - model_phishing_prob) * 100, 2) if not model_says_phishing else round(model_phishing_prob * 100, 2),
                 'ai_confidence': ai_result['confidence']
             }
+        result['model_tier'] = tier
         
         if 'user_id' in session:
-            save_search(session['user_id'], 'url', url_text, result['label'],
-                       result['confidence'], result['verification'], result.get('reason'))
+            history_writer.submit(session['user_id'], 'url', url_text, result['label'],
+                                  result['confidence'], result['verification'], result.get('reason'))
         return jsonify(result)
         
     except Exception as e:
@@ -474,10 +647,108 @@ def get_metrics():
     """Return model metrics for stats page"""
     return jsonify(model_metrics)
 
+@app.route('/api/metrics/runtime')
+def get_runtime_metrics():
+    """Return in-process runtime metrics (coalescing, caches, queues)"""
+    return jsonify(runtime_snapshot())
+
+HISTORY_PAGE_MAX = 200
+HISTORY_EXPORT_COLUMNS = ['id', 'search_type', 'input_text', 'result', 'confidence',
+                          'verification', 'reason', 'searched_at']
+HISTORY_EXPORT_CHUNK = 64 * 1024  # characters buffered per streamed chunk
+
+def encode_history_cursor(row):
+    """Opaque pagination cursor for the (searched_at, id) of a history row"""
+    raw = json.dumps([row['searched_at'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_history_cursor(cursor):
+    """Inverse of encode_history_cursor; raises ValueError on a malformed cursor"""
+    try:
+        searched_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(searched_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+@app.route('/api/history', methods=['GET'])
+@login_required
+def history_api():
+    """Page through history newest first: ?limit=&cursor=&type=&result=&archived=1"""
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), HISTORY_PAGE_MAX)
+        cursor = request.args.get('cursor')
+        before = decode_history_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    
+    if not cursor:
+        history_writer.flush()
+    # Fetch one extra row to know whether another page exists
+    items = get_user_history_page(
+        session['user_id'], limit=limit + 1, before=before,
+        search_type=request.args.get('type'), result=request.args.get('result'),
+        include_archived=request.args.get('archived') == '1'
+    )
+    has_more = len(items) > limit
+    items = items[:limit]
+    return jsonify({
+        'success': True,
+        'items': items,
+        'next_cursor': encode_history_cursor(items[-1]) if has_more else None
+    })
+
+@app.route('/api/history/export', methods=['GET'])
+@login_required
+def export_history():
+    """Stream the full history as CSV or NDJSON: ?format=csv|ndjson&type=&result=&archived=1"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson', 'success': False}), 400
+    
+    history_writer.flush()
+    rows = iter_user_history(session['user_id'], search_type=request.args.get('type'),
+                             result=request.args.get('result'),
+                             include_archived=request.args.get('archived') == '1')
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(HISTORY_EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow([row[col] for col in HISTORY_EXPORT_COLUMNS])
+            if buffer.tell() >= HISTORY_EXPORT_CHUNK:
+                # Hand the chunk to the client and reuse the buffer
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    def generate_ndjson():
+        lines, size = [], 0
+        for row in rows:
+            line = json.dumps({col: row[col] for col in HISTORY_EXPORT_COLUMNS}) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= HISTORY_EXPORT_CHUNK:
+                yield ''.join(lines)
+                lines, size = [], 0
+        yield ''.join(lines)
+    
+    if fmt == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=search_history.{fmt}'}
+    )
+
 @app.route('/api/history/<int:history_id>', methods=['DELETE'])
 @login_required
 def delete_history(history_id):
     """Delete a single history item"""
+    history_writer.flush()
     success = delete_history_item(session['user_id'], history_id)
     return jsonify({'success': success})
 
@@ -485,67 +756,219 @@ def delete_history(history_id):
 @login_required
 def clear_history():
     """Clear all history for user"""
+    history_writer.flush()
     clear_user_history(session['user_id'])
     return jsonify({'success': True})
 
+def get_uploaded_file():
+    """Return (file, None) for a valid upload, or (None, error response)"""
+    if 'file' not in request.files:
+        return None, (jsonify({'error': 'No file uploaded', 'success': False}), 400)
+    
+    file = request.files['file']
+    if file.filename == '':
+        return None, (jsonify({'error': 'No file selected', 'success': False}), 400)
+    
+    if not allowed_file(file.filename):
+        return None, (jsonify({
+            'error': 'File type not supported. Allowed: images, PDF, DOCX, TXT, EML',
+            'success': False
+        }), 400)
+    return file, None
+
+def extraction_error(extracted_text):
+    """Error response if extraction failed or returned an error message, else None"""
+    if not extracted_text:
+        return jsonify({
+            'error': 'No text could be extracted from the file',
+            'success': False
+        }), 400
+    
+    if extracted_text.startswith(('Error', 'Unsupported')):
+        return jsonify({
+            'error': extracted_text,
+            'success': False
+        }), 400
+    
+    if 'No text found' in extracted_text or 'not supported' in extracted_text:
+        return jsonify({
+            'error': extracted_text,
+            'success': False
+        }), 400
+    return None
+
+def classify_token_budget():
+    """Tokens of an upload the email model will read (see CLASSIFY_TOKEN_BUDGET)"""
+    if app.config['CLASSIFY_TOKEN_BUDGET']:
+        return app.config['CLASSIFY_TOKEN_BUDGET']
+    if app.config['EMAIL_WINDOW_POOLING']:
+        return window_token_budget(150, app.config['EMAIL_MAX_WINDOWS'])
+    return 150
+
 @app.route('/api/upload/extract', methods=['POST'])
 @login_required
 def upload_and_extract():
-    """Upload file and extract text"""
+    """Upload file and extract text
+
+    Form field purpose=classify stops extraction once classify_token_budget()
+    tokens are available (enough for the model); the default extracts the
+    whole document for display.
+    """
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded', 'success': False}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected', 'success': False}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({
-                'error': 'File type not supported. Allowed: images, PDF, DOCX, TXT, EML',
-                'success': False
-            }), 400
+        file, error = get_uploaded_file()
+        if error:
+            return error
         
-        # Save file with unique name to avoid conflicts
-        import uuid
+        # Extract straight from the upload stream (in memory, or spooled to
+        # disk above UPLOAD_SPOOL_THRESHOLD); the type comes from magic bytes
         original_filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4().hex}_{original_filename}"
-        filepath = os.path.join(UPLOAD_DIR, unique_filename)
-        file.save(filepath)
+        truncated = False
+        if request.form.get('purpose') == 'classify':
+            # A cached full extraction beats even a budgeted one
+            extracted_text = extraction_cache.lookup(file.stream)
+            if extracted_text is None:
+                extracted_text, truncated = extract_text_for_classification(
+                    file.stream, token_budget=classify_token_budget())
+        else:
+            extracted_text = extraction_cache.extract(file.stream, extract_text_from_file)
         
-        # Extract text
-        extracted_text = extract_text_from_file(filepath)
+        # Check if extraction failed or returned error message
+        error = extraction_error(extracted_text)
+        if error:
+            return error
         
-        # Clean up file
-        try:
-            os.remove(filepath)
-        except:
-            pass
+        return jsonify({
+            'success': True,
+            'text': extracted_text,
+            'filename': original_filename,
+            'truncated': truncated
+        })
         
-        # Check if extraction failed or returned error message
-        if not extracted_text:
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 500
+
+def score_urls(urls):
+    """
+    Phishing probability for each URL: the lexical feature stage where it
+    is confident, the rest from one batched URL model call
+    """
+    if not urls:
+        return []
+    probs = np.full(len(urls), np.nan)
+    if url_feature_tier is not None:
+        fast = url_feature_tier.predict_proba(urls)
+        confident = url_feature_tier.confident(fast)
+        probs[confident] = fast[confident]
+        incr('url_features.decided', int(confident.sum()))
+        incr('url_features.deferred', int((~confident).sum()))
+    pending = np.flatnonzero(np.isnan(probs))
+    if pending.size:
+        seq = texts_to_sequences(url_tokenizer, clean_urls([urls[i] for i in pending]), maxlen=80)
+        probs[pending] = np.asarray(url_model.predict(seq, batch_size=URL_BATCH_SIZE, verbose=0)).ravel()
+    return [float(p) for p in probs]
+
+@app.route('/api/upload/classify', methods=['POST'])
+@login_required
+def upload_and_classify():
+    """Upload a file, extract its text and classify it in one request
+
+    The text goes through the email pipeline, and every link in the body
+    (and, for EML files, in all text and HTML parts) is scored by the URL
+    model in a single batch. The upload is spam if the email verdict is
+    spam or any link looks like phishing.
+    """
+    try:
+        if email_model is None or email_tokenizer is None:
             return jsonify({
-                'error': 'No text could be extracted from the file',
+                'error': 'Email model not loaded. Please train the model first.',
                 'success': False
-            }), 400
+            }), 503
         
-        if extracted_text.startswith('Error'):
-            return jsonify({
-                'error': extracted_text,
-                'success': False
-            }), 400
+        file, error = get_uploaded_file()
+        if error:
+            return error
         
-        if 'No text found' in extracted_text or 'not supported' in extracted_text:
-            return jsonify({
-                'error': extracted_text,
-                'success': False
-            }), 400
+        original_filename = secure_filename(file.filename)
+        extracted_text = extraction_cache.extract(file.stream, extract_text_from_file)
+        error = extraction_error(extracted_text)
+        if error:
+            return error
+        
+        email_result = classify_email(extracted_text)
+        
+        # Stage 3: score every embedded link in one URL model batch
+        links = []
+        urls = extract_links(file.stream, extracted_text)
+        if urls and url_model is not None and url_tokenizer is not None:
+            for url, prob in zip(urls, score_urls(urls)):
+                is_phishing = prob > 0.5
+                links.append({
+                    'url': url,
+                    'is_phishing': is_phishing,
+                    'label': 'Phishing' if is_phishing else 'Legitimate',
+                    'confidence': round((prob if is_phishing else 1 - prob) * 100, 2)
+                })
+        phishing_links = [link for link in links if link['is_phishing']]
+        
+        is_spam = email_result['is_spam'] or bool(phishing_links)
+        if email_result['is_spam'] or not phishing_links:
+            confidence = email_result['confidence']
+            reason = email_result['reason']
+        else:
+            confidence = max(link['confidence'] for link in phishing_links)
+            reason = f"{len(phishing_links)} of {len(links)} links look like phishing (e.g. {phishing_links[0]['url']})"
+        
+        result = {
+            'success': True,
+            'is_spam': is_spam,
+            'label': 'Spam' if is_spam else 'Legitimate',
+            'confidence': confidence,
+            'reason': reason,
+            'filename': original_filename,
+            'email': email_result,
+            'links': links,
+            'links_scanned': len(links),
+            'phishing_links': len(phishing_links)
+        }
+        
+        history_writer.submit(session['user_id'], 'email', extracted_text, result['label'],
+                              result['confidence'], email_result['verification'], reason)
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 500
+
+# ========== EXTRACTION JOBS ==========
+
+JOB_EVENT_KEEPALIVE = 15  # seconds between keep-alive comments on idle event streams
+
+@app.route('/api/jobs/extract', methods=['POST'])
+@login_required
+def submit_extraction_job():
+    """Queue a file for background extraction; poll or subscribe to the returned job"""
+    try:
+        file, error = get_uploaded_file()
+        if error:
+            return error
+        
+        try:
+            job = extraction_jobs.submit(session['user_id'], file, secure_filename(file.filename))
+        except JobRejected as e:
+            return jsonify({'error': str(e), 'success': False}), 503
         
         return jsonify({
             'success': True,
-            'text': extracted_text,
-            'filename': original_filename
-        })
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('extraction_job_status', job_id=job.id),
+            'events_url': url_for('extraction_job_events', job_id=job.id)
+        }), 202
         
     except Exception as e:
         return jsonify({
@@ -553,6 +976,40 @@ def upload_and_extract():
             'success': False
         }), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def extraction_job_status(job_id):
+    """Status, progress (pages done / total) and, once finished, the text or error"""
+    job = extraction_jobs.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({'error': 'Job not found', 'success': False}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def extraction_job_events(job_id):
+    """Server-sent events: one 'progress' event per change, then a final 'done' or 'failed'"""
+    job = extraction_jobs.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({'error': 'Job not found', 'success': False}), 404
+    
+    def generate():
+        version = None
+        while True:
+            state, new_version = extraction_jobs.wait(job, version, timeout=JOB_EVENT_KEEPALIVE)
+            if new_version == version:
+                yield ': keep-alive\n\n'
+                continue
+            version = new_version
+            finished = state['status'] in ('done', 'failed')
+            event = state['status'] if finished else 'progress'
+            yield f'event: {event}\ndata: {json.dumps(state)}\n\n'
+            if finished:
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
     print('='*60)
     print('SPAM DETECTION SYSTEM - Starting Flask App')
@@ -0,0 +1,207 @@
+"""
+Benchmark the database layer on a throwaway database.
+
+    python bench_database.py connections   # pooled WAL connections vs connect-per-call
+    python bench_database.py indexes       # hot queries with vs without indexes
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix='spam_db_bench_'))
+# Point the database module at a scratch file before it is imported
+os.environ['SPAM_DETECTION_DB'] = str(TMP_DIR / 'bench.db')
+
+import database
+
+SEARCH_TYPES = ['email', 'sms', 'url']
+RESULTS = ['Spam', 'Legitimate', 'Phishing']
+
+def timed(fn, iterations):
+    """Run fn repeatedly and return per-call latencies in milliseconds"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'  {label:<38} mean {statistics.mean(latencies):8.3f} ms   p95 {p95:8.3f} ms')
+
+def create_user(username):
+    result = database.create_user(username, f'{username}@example.com', 'benchmark-password')
+    return result['user_id']
+
+def synthetic_rows(user_id, count, seed=0):
+    """Yield synthetic search_history rows spread over the last year"""
+    for i in range(seed, seed + count):
+        yield (
+            user_id,
+            SEARCH_TYPES[i % 3],
+            f'synthetic benchmark input {i}',
+            RESULTS[i % 3],
+            50.0 + i % 50,
+            'OpenRouter AI Verification',
+            'benchmark row',
+            f'2025-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:{(i // 60) % 60:02d}'
+        )
+
+def insert_rows(path, rows):
+    conn = sqlite3.connect(str(path))
+    conn.executemany('''
+        INSERT INTO search_history (user_id, search_type, input_text, result, confidence, verification, reason, searched_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+def clone_schema(path):
+    """Create an empty rollback-journal database with the same schema"""
+    src = sqlite3.connect(str(database.DATABASE))
+    statements = [row[0] for row in src.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+    )]
+    src.close()
+    conn = sqlite3.connect(str(path))
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+# ---- Baseline: the original connect / execute / close per call ----
+
+def baseline_save(path, user_id):
+    conn = sqlite3.connect(str(path))
+    conn.execute('''
+        INSERT INTO search_history (user_id, search_type, input_text, result, confidence, verification, reason)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, 'sms', 'benchmark message', 'Spam', 99.0, 'OpenRouter AI Verification', 'benchmark'))
+    conn.commit()
+    conn.close()
+
+def baseline_history_page(path, user_id):
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        SELECT * FROM search_history WHERE user_id = ? ORDER BY searched_at DESC LIMIT 50
+    ''', (user_id,)).fetchall()
+    conn.close()
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute('SELECT COUNT(*) FROM search_history WHERE user_id = ?', (user_id,)).fetchone()
+    conn.execute('SELECT search_type, COUNT(*) FROM search_history WHERE user_id = ? GROUP BY search_type', (user_id,)).fetchall()
+    conn.execute('SELECT result, COUNT(*) FROM search_history WHERE user_id = ? GROUP BY result', (user_id,)).fetchall()
+    conn.close()
+
+def bench_connections(args):
+    """Compare pooled WAL connections with the original connect-per-call pattern"""
+    user_id = create_user('bench_connections')
+    baseline_path = TMP_DIR / 'baseline.db'
+    clone_schema(baseline_path)
+    rows = list(synthetic_rows(user_id, args.rows))
+    insert_rows(database.DATABASE, rows)
+    insert_rows(baseline_path, rows)
+
+    print(f'History rows per user: {args.rows}, iterations: {args.iterations}')
+    print('\nHistory page (get_user_history + get_user_stats):')
+    report('connect-per-call, rollback journal', timed(lambda: baseline_history_page(baseline_path, user_id), args.iterations))
+    report('pooled connection, WAL', timed(lambda: (database.get_user_history(user_id), database.get_user_stats(user_id)), args.iterations))
+
+    print('\nPredict write path (save_search):')
+    report('connect-per-call, rollback journal', timed(lambda: baseline_save(baseline_path, user_id), args.iterations))
+    report('pooled connection, WAL', timed(
+        lambda: database.save_search(user_id, 'sms', 'benchmark message', 'Spam', 99.0, 'OpenRouter AI Verification', 'benchmark'),
+        args.iterations
+    ))
+
+# The per-user aggregate get_user_stats ran before the user_stats rollup
+GROUP_BY_STATS = '''
+    SELECT search_type, result, COUNT(*) FROM search_history
+    WHERE user_id = ?
+    GROUP BY search_type, result
+'''
+
+def middle_cursor(conn, user_id):
+    """(searched_at, id) keyset cursor halfway through a user's history, newest first"""
+    count = conn.execute('SELECT COUNT(*) FROM search_history WHERE user_id = ?', (user_id,)).fetchone()[0]
+    row = conn.execute('''
+        SELECT searched_at, id FROM search_history
+        WHERE user_id = ?
+        ORDER BY searched_at DESC, id DESC
+        LIMIT 1 OFFSET ?
+    ''', (user_id, count // 2)).fetchone()
+    return tuple(row)
+
+def without_indexes(sql):
+    """Force a full table scan by disabling index use for search_history"""
+    return sql.replace('FROM search_history', 'FROM search_history NOT INDEXED')
+
+def bench_indexes(args):
+    """Time the hot history queries on a multi-million-row synthetic history"""
+    heavy_user = create_user('bench_heavy')
+    print(f'Generating {args.rows:,} synthetic history rows across {args.users} users...')
+    start = time.perf_counter()
+    per_user = args.rows // args.users
+    rows = (row for u in range(args.users)
+            for row in synthetic_rows(heavy_user if u == 0 else heavy_user + u, per_user, seed=u * per_user))
+    insert_rows(database.DATABASE, rows)
+    print(f'  done in {time.perf_counter() - start:.1f}s')
+    # Raw inserts bypass the write path, so fill the stats rollup the way a migration would
+    start = time.perf_counter()
+    print(f'Rebuilt user_stats ({database.rebuild_user_stats():,} rows) in {time.perf_counter() - start:.1f}s')
+
+    with database.db_connection() as conn:
+        conn.execute('ANALYZE')
+        conn.commit()
+
+    for name, details in database.explain_hot_queries().items():
+        print(f'  plan {name:<16} {" | ".join(details)}')
+
+    for name, (sql, params) in database.HOT_QUERIES.items():
+        with database.db_connection() as conn:
+            if name == 'history_page':
+                # A real page: the HOT_QUERIES cursor ('', 0) matches no rows
+                params = (heavy_user,) + middle_cursor(conn, heavy_user) + tuple(params[3:])
+            else:
+                params = (heavy_user,) + tuple(params[1:])
+            print(f'\n{name} ({len(conn.execute(sql, params).fetchall())} rows):')
+            if name == 'stats':
+                # user_stats is read by primary key; the comparison is the aggregate it replaced
+                report('user_stats rollup', timed(lambda: conn.execute(sql, params).fetchall(), args.iterations))
+                report('GROUP BY over search_history', timed(
+                    lambda: conn.execute(GROUP_BY_STATS, params).fetchall(), max(1, args.iterations // 10)
+                ))
+                continue
+            report('indexed', timed(lambda: conn.execute(sql, params).fetchall(), args.iterations))
+            report('full table scan (NOT INDEXED)', timed(
+                lambda: conn.execute(without_indexes(sql), params).fetchall(), max(1, args.iterations // 10)
+            ))
+
+def main():
+    parser = argparse.ArgumentParser(description='Database benchmarks (run against a temporary database)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('connections', help='pooled WAL connections vs connect-per-call')
+    p.add_argument('--rows', type=int, default=5000, help='history rows for the benchmark user')
+    p.add_argument('--iterations', type=int, default=500)
+    p.set_defaults(func=bench_connections)
+
+    p = sub.add_parser('indexes', help='hot queries with vs without indexes')
+    p.add_argument('--rows', type=int, default=2_000_000, help='total synthetic history rows')
+    p.add_argument('--users', type=int, default=200)
+    p.add_argument('--iterations', type=int, default=100)
+    p.set_defaults(func=bench_indexes)
+
+    args = parser.parse_args()
+    print(f'Scratch database directory: {TMP_DIR}')
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark length-aware serving of the email and SMS LSTMs.
+
+    python bench_inference.py [--model email|sms] [--requests 300] [--short 20]
+
+Compares the sequence modes from ml_utils.length_aware_model (off = full
+post-padded length, trim, mask) on the trainers' held-out test split:
+accuracy on all and on short inputs (at most --short tokens), agreement
+with 'off', and single-request predict latency for short and for typical
+inputs. Needs trained models in models/ and the datasets (or their cache).
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+from tensorflow.keras.models import load_model
+
+from ml_utils import LengthAwareModel, length_aware_model
+from train_utils import sequence_lengths, split_dataset
+
+BASE = Path(__file__).resolve().parent
+MODES = ('off', 'trim', 'mask')
+
+def load_test_split(name):
+    if name == 'email':
+        from train_email import load_dataset
+    else:
+        from train_sms import load_dataset
+    X, y, _ = load_dataset()
+    _, X_test, _, y_test = split_dataset(X, y)
+    return np.asarray(X_test), np.asarray(y_test)
+
+def latency_ms(model, rows, repeat=1):
+    """Per-request (batch of 1) predict latency in ms for each row"""
+    samples = []
+    for row in rows:
+        batch = row[None, :]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model.predict(batch, verbose=0)
+        samples.append((time.perf_counter() - start) * 1000 / repeat)
+    return samples
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q))
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency and accuracy of length-aware LSTM serving')
+    parser.add_argument('--model', choices=['email', 'sms'], default='sms')
+    parser.add_argument('--requests', type=int, default=300, help='single-input requests timed per mode and input group')
+    parser.add_argument('--short', type=int, default=20, help='inputs of at most this many tokens count as short')
+    args = parser.parse_args()
+
+    model = load_model(str(BASE / 'models' / f'{args.model}_model.h5'))
+    X_test, y_test = load_test_split(args.model)
+    lengths = sequence_lengths(X_test)
+    short = lengths <= args.short
+    rng = np.random.default_rng(42)
+    short_rows = X_test[rng.permutation(np.flatnonzero(short))[:args.requests]]
+    typical_rows = X_test[rng.permutation(len(X_test))[:args.requests]]
+
+    print(f'{args.model} model, padded length {X_test.shape[1]}; test split: {len(X_test)} inputs, '
+          f'{short.sum()} short (<= {args.short} tokens), median length {np.median(lengths):.0f}')
+
+    results = {}
+    baseline = None
+    for mode in MODES:
+        # 'off' goes through the same wrapper (predict_on_batch), just without
+        # trimming, so the latencies differ only by sequence handling
+        serving = length_aware_model(model, mode) if mode != 'off' else LengthAwareModel(model, trim=False)
+        prob = serving.predict(X_test, batch_size=256, verbose=0).ravel()
+        pred = (prob > 0.5).astype(int)
+        if baseline is None:
+            baseline = pred
+        # Warm up: trace every input width this mode can produce
+        latency_ms(serving, typical_rows[:20])
+        results[mode] = {
+            'acc': float((pred == y_test).mean()),
+            'short_acc': float((pred[short] == y_test[short]).mean()) if short.any() else float('nan'),
+            'agree': float((pred == baseline).mean()),
+            'short_ms': latency_ms(serving, short_rows),
+            'typical_ms': latency_ms(serving, typical_rows)
+        }
+
+    print(f'\n{"mode":<6} {"accuracy":>9} {"short acc":>10} {"agree":>7} '
+          f'{"short p50":>10} {"short p95":>10} {"typ p50":>9} {"typ p95":>9}')
+    for mode, r in results.items():
+        print(f'{mode:<6} {r["acc"]:>9.4f} {r["short_acc"]:>10.4f} {r["agree"]:>7.2%} '
+              f'{percentile(r["short_ms"], 50):>8.2f}ms {percentile(r["short_ms"], 95):>8.2f}ms '
+              f'{percentile(r["typical_ms"], 50):>7.2f}ms {percentile(r["typical_ms"], 95):>7.2f}ms')
+
+    off = statistics.median(results['off']['short_ms'])
+    for mode in MODES[1:]:
+        print(f'{mode}: short-input median latency {off / statistics.median(results[mode]["short_ms"]):.2f}x vs off')
+
+if __name__ == '__main__':
+    main()
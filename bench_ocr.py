@@ -0,0 +1,78 @@
+"""
+Benchmark OCR time and accuracy with and without image preprocessing.
+
+    python bench_ocr.py path/to/corpus [--repeat 1]
+
+The corpus directory holds images (png, jpg, jpeg, bmp, gif, tif, tiff,
+webp); an image's ground truth, if any, is a .txt file with the same name
+(invoice.png -> invoice.txt). Accuracy is the character-level similarity
+(difflib ratio) of the OCR output to the ground truth, after collapsing
+whitespace.
+"""
+import argparse
+import difflib
+import statistics
+import time
+from pathlib import Path
+
+from PIL import Image
+import pytesseract
+
+from file_extractor import preprocess_for_ocr
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp'}
+
+def normalize(text):
+    return ' '.join(text.split())
+
+def accuracy(text, truth):
+    return difflib.SequenceMatcher(None, normalize(text), normalize(truth)).ratio()
+
+def run_ocr(image, preprocess, repeat):
+    """Return (seconds per run including preprocessing, text)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        prepared = preprocess_for_ocr(image) if preprocess else image
+        text = pytesseract.image_to_string(prepared)
+    return (time.perf_counter() - start) / repeat, text
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR time vs accuracy, raw vs preprocessed images')
+    parser.add_argument('corpus', type=Path)
+    parser.add_argument('--repeat', type=int, default=1, help='OCR runs per image and mode')
+    args = parser.parse_args()
+
+    images = sorted(p for p in args.corpus.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not images:
+        raise SystemExit(f'No images found in {args.corpus}')
+
+    rows = []
+    print(f'{"image":<32} {"size":>11} {"raw s":>8} {"prep s":>8} {"raw acc":>8} {"prep acc":>9}')
+    for path in images:
+        image = Image.open(path)
+        image.load()
+        truth_path = path.with_suffix('.txt')
+        truth = truth_path.read_text(encoding='utf-8', errors='ignore') if truth_path.exists() else None
+
+        raw_time, raw_text = run_ocr(image, False, args.repeat)
+        prep_time, prep_text = run_ocr(image, True, args.repeat)
+        raw_acc = accuracy(raw_text, truth) if truth is not None else None
+        prep_acc = accuracy(prep_text, truth) if truth is not None else None
+        rows.append((raw_time, prep_time, raw_acc, prep_acc))
+
+        fmt = lambda value: f'{value:.3f}' if value is not None else '-'
+        size = f'{image.width}x{image.height}'
+        print(f'{path.name[:32]:<32} {size:>11} {raw_time:8.2f} {prep_time:8.2f} {fmt(raw_acc):>8} {fmt(prep_acc):>9}')
+
+    raw_total = sum(r[0] for r in rows)
+    prep_total = sum(r[1] for r in rows)
+    print(f'\nTotal OCR time: raw {raw_total:.2f}s, preprocessed {prep_total:.2f}s '
+          f'({raw_total / max(prep_total, 1e-9):.2f}x)')
+    scored = [r for r in rows if r[2] is not None]
+    if scored:
+        print(f'Mean accuracy over {len(scored)} images with ground truth: '
+              f'raw {statistics.mean(r[2] for r in scored):.3f}, '
+              f'preprocessed {statistics.mean(r[3] for r in scored):.3f}')
+
+if __name__ == '__main__':
+    main()
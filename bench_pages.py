@@ -0,0 +1,63 @@
+"""
+Benchmark page render latency with and without the in-process user cache.
+
+    python bench_pages.py [--iterations 500]
+
+Runs the Flask app in-process (test client) against a throwaway database.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix='spam_pages_bench_'))
+os.environ['SPAM_DETECTION_DB'] = str(TMP_DIR / 'bench.db')
+
+import database
+from app import app
+
+PAGES = ['/', '/email', '/sms', '/url', '/stats', '/history']
+
+def bench(client, iterations):
+    latencies = {}
+    for page in PAGES:
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = client.get(page)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, f'{page} returned {response.status_code}'
+        latencies[page] = samples
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description='Page latency with and without the user cache')
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    user_id = database.create_user('bench_pages', 'bench_pages@example.com', 'benchmark-password')['user_id']
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = 'bench_pages'
+
+    cache = database._user_cache
+    maxsize = cache.maxsize
+    cache.maxsize = 0
+    cache.clear()
+    uncached = bench(client, args.iterations)
+    cache.maxsize = maxsize
+    hits, misses = cache._hits, cache._misses
+    cached = bench(client, args.iterations)
+    hits, misses = cache._hits - hits, cache._misses - misses
+
+    print(f'Mean page latency over {args.iterations} requests (ms)')
+    print(f'  {"page":<10} {"no cache":>10} {"cache":>10}')
+    for page in PAGES:
+        print(f'  {page:<10} {statistics.mean(uncached[page]):10.3f} {statistics.mean(cached[page]):10.3f}')
+    print(f'\nUser cache hit rate (cached run): {hits / max(1, hits + misses):.1%}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark sliding-window scoring of long emails.
+
+    python bench_windows.py [--lengths 150 300 600 1200 2400] [--docs 64] [--max-windows 8]
+
+Latency: documents of each length (in tokens) are scored one at a time and
+as one batch, truncated to the first 150 tokens (the old behaviour) and
+with windowed max / attention pooling.
+
+Buried payloads: spam emails from the test split are placed after a benign
+preamble (ham emails from the test split) of increasing length, and the
+recall of truncated vs windowed scoring is reported. Needs the trained
+email model and the email dataset (or its cache).
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+from tensorflow.keras.models import load_model
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+from ml_utils import WINDOW_POOLING, length_aware_model, score_long_documents
+from train_email import load_dataset
+from train_utils import split_dataset
+
+BASE = Path(__file__).resolve().parent
+MAXLEN = 150
+
+class SequenceTokenizer:
+    """Stands in for the Keras tokenizer when the 'texts' are already token id lists"""
+    def texts_to_sequences(self, texts):
+        return [list(tokens) for tokens in texts]
+
+def truncated_scores(model, docs):
+    seq = pad_sequences(docs, maxlen=MAXLEN, padding='post', truncating='post')
+    return np.asarray(model.predict(seq, batch_size=max(32, len(seq)), verbose=0)).ravel()
+
+def windowed_scores(model, docs, pooling, max_windows):
+    return np.asarray(score_long_documents(model, SequenceTokenizer(), docs, maxlen=MAXLEN,
+                                           max_windows=max_windows, pooling=pooling))
+
+def timed(fn, repeat=3):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency and recall of sliding-window email scoring')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[150, 300, 600, 1200, 2400])
+    parser.add_argument('--docs', type=int, default=64, help='documents per length')
+    parser.add_argument('--max-windows', type=int, default=8)
+    args = parser.parse_args()
+
+    model = length_aware_model(load_model(str(BASE / 'models' / 'email_model.h5')), 'auto')
+    X, y, tokenizer = load_dataset()
+    _, X_test, _, y_test = split_dataset(X, y)
+    token_lists = [row[row != 0].tolist() for row in np.asarray(X_test)]
+    vocab = min(tokenizer.num_words or len(tokenizer.word_index), len(tokenizer.word_index))
+    rng = np.random.default_rng(42)
+
+    print(f'Latency (ms), windows of {MAXLEN} tokens, at most {args.max_windows} per document')
+    print(f'{"tokens":>7} {"truncate 1":>11} {"window 1":>9} {"truncate batch":>15} {"window batch":>13}')
+    for length in args.lengths:
+        docs = [rng.integers(2, vocab, length).tolist() for _ in range(args.docs)]
+        print(f'{length:>7} '
+              f'{timed(lambda: truncated_scores(model, docs[:1])):>11.2f} '
+              f'{timed(lambda: windowed_scores(model, docs[:1], "max", args.max_windows)):>9.2f} '
+              f'{timed(lambda: truncated_scores(model, docs)):>15.2f} '
+              f'{timed(lambda: windowed_scores(model, docs, "max", args.max_windows)):>13.2f}')
+
+    spam = [tokens for tokens, label in zip(token_lists, y_test) if label == 1][:args.docs * 4]
+    ham = [token for tokens, label in zip(token_lists, y_test) if label == 0 for token in tokens]
+    if not spam or not ham:
+        return
+    print(f'\nRecall on {len(spam)} spam emails buried after a ham preamble')
+    print(f'{"preamble":>9} {"truncate":>9} ' + ' '.join(f'{pooling:>9}' for pooling in WINDOW_POOLING))
+    for preamble in [0] + args.lengths:
+        docs = []
+        for tokens in spam:
+            start = rng.integers(0, max(1, len(ham) - preamble))
+            docs.append(ham[start:start + preamble] + tokens)
+        recall = [(truncated_scores(model, docs) > 0.5).mean()]
+        recall += [(windowed_scores(model, docs, pooling, args.max_windows) > 0.5).mean()
+                   for pooling in WINDOW_POOLING]
+        print(f'{preamble:>9} ' + ' '.join(f'{r:>9.3f}' for r in recall))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Bounded in-process caches with hit-rate metrics"""
+import threading
+import time
+from collections import OrderedDict
+
+from runtime_metrics import incr, set_gauge
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with an optional per-entry time-to-live.
+
+    Holds at most maxsize entries, evicting the least recently used one.
+    Hits and misses are counted in the runtime metrics as <name>.hits /
+    <name>.misses, with the running hit rate as the <name>.hit_rate gauge.
+    """
+    def __init__(self, name, maxsize=1024, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and (entry[1] is None or entry[1] > now):
+                self._data.move_to_end(key)
+                self._hits += 1
+                hit = True
+            else:
+                if entry is not _MISSING:
+                    del self._data[key]
+                self._misses += 1
+                hit = False
+            hit_rate = self._hits / (self._hits + self._misses)
+        incr(f'{self.name}.hits' if hit else f'{self.name}.misses')
+        set_gauge(f'{self.name}.hit_rate', round(hit_rate, 4))
+        return entry[0] if hit else default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                incr(f'{self.name}.evictions')
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,99 @@
+"""Streaming CSV loading for the training datasets: format sniffing and reservoir sampling"""
+import codecs
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+SNIFF_BYTES = 64 * 1024   # prefix used to detect encoding and delimiter
+CHUNK_ROWS = 50_000       # rows parsed per chunk
+
+def sniff_format(path, delimiters=',\t|;', sniff_bytes=SNIFF_BYTES):
+    """
+    Detect (encoding, delimiter) from the first sniff_bytes of a file.
+
+    The encoding is utf-8 (utf-8-sig with a BOM) if the prefix decodes
+    cleanly, else latin1, which accepts any byte. The delimiter is the first
+    of `delimiters` (in order of preference) that splits nearly every sampled
+    row into the same number of fields, else csv.Sniffer's pick.
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(sniff_bytes)
+
+    if prefix.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+    try:
+        # Incremental decode: a multi-byte character cut off at the end of the prefix is fine
+        sample = codecs.getincrementaldecoder(encoding)().decode(prefix, final=False)
+    except UnicodeDecodeError:
+        encoding = 'latin1'
+        sample = prefix.decode(encoding)
+
+    # Only whole lines, so the sniffer doesn't see a truncated record
+    if len(prefix) == sniff_bytes and '\n' in sample:
+        sample = sample[:sample.rindex('\n')]
+    for delimiter in delimiters:
+        if _splits_consistently(sample, delimiter):
+            return encoding, delimiter
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=delimiters).delimiter
+    except csv.Error:
+        delimiter = delimiters[0]
+    return encoding, delimiter
+
+def _splits_consistently(sample, delimiter, min_share=0.9):
+    """Whether at least min_share of the sample's rows have the same field count (> 1)"""
+    try:
+        counts = [len(row) for row in csv.reader(io.StringIO(sample), delimiter=delimiter) if row]
+    except csv.Error:
+        return False
+    if not counts:
+        return False
+    values, frequency = np.unique(counts, return_counts=True)
+    return values[frequency.argmax()] > 1 and frequency.max() >= min_share * len(counts)
+
+def read_sample(path, n=None, seed=42, header='infer', delimiters=',\t|;', chunksize=CHUNK_ROWS):
+    """
+    Read a CSV in chunks, keeping a uniform random sample of at most n rows.
+
+    Each row gets a random key from a generator seeded with `seed` and the n
+    rows with the smallest keys are kept (reservoir sampling, vectorized per
+    chunk), so peak memory is bounded by n + chunksize rows whatever the file
+    size, and the same file and seed always give the same sample. Rows are
+    returned in file order. n=None keeps every row.
+    """
+    encoding, delimiter = sniff_format(path, delimiters)
+    reader = pd.read_csv(
+        path, sep=delimiter, encoding=encoding, encoding_errors='replace',
+        header=header, on_bad_lines='skip', chunksize=chunksize
+    )
+    rng = np.random.default_rng(seed)
+
+    kept = []
+    keys = np.empty(0)
+    reservoir = None
+    with reader:
+        for chunk in reader:
+            if n is None:
+                kept.append(chunk)
+                continue
+            chunk_keys = rng.random(len(chunk))
+            candidates = chunk if reservoir is None else pd.concat([reservoir, chunk])
+            candidate_keys = np.concatenate([keys, chunk_keys])
+            if len(candidates) > n:
+                keep = np.argpartition(candidate_keys, n - 1)[:n]
+                candidates = candidates.iloc[keep]
+                candidate_keys = candidate_keys[keep]
+            reservoir, keys = candidates, candidate_keys
+
+    if n is None:
+        if not kept:
+            return pd.DataFrame()
+        return pd.concat(kept, ignore_index=True)
+    if reservoir is None:
+        return pd.DataFrame()
+    # The chunks' RangeIndex continues across chunks, so it is the row number
+    return reservoir.sort_index().reset_index(drop=True)
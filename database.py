@@ -1,174 +1,520 @@
 """Database models for User Authentication and Search History"""
+import multiprocessing
+import os
+import queue
 import sqlite3
+import sys
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from pathlib import Path
 
-DATABASE = Path(__file__).resolve().parent / 'spam_detection.db'
+from caching import TTLCache
+
+DATABASE = Path(os.environ.get('SPAM_DETECTION_DB', Path(__file__).resolve().parent / 'spam_detection.db'))
+
+# Connection tuning
+POOL_SIZE = 8                 # idle connections kept for reuse
+BUSY_TIMEOUT_MS = 5000        # wait this long on a locked database before failing
+STATEMENT_CACHE_SIZE = 256    # prepared statements cached per connection
+
+# User records are read on every page render; cache them briefly in-process
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60           # seconds
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(str(DATABASE))
+    """Open a new database connection (WAL mode, NORMAL sync, busy timeout)"""
+    conn = sqlite3.connect(
+        str(DATABASE),
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False
+    )
     conn.row_factory = sqlite3.Row
+    # WAL lets readers run while a writer commits; NORMAL sync is durable
+    # across application crashes and only fsyncs at checkpoints
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
     return conn
 
+class ConnectionPool:
+    """
+    Small pool of long-lived connections shared by worker threads.
+
+    A connection is used by one thread at a time; on release it is returned
+    to the pool so the next request reuses it (and its statement cache)
+    instead of paying for connect + PRAGMA setup again.
+    """
+    def __init__(self, size=POOL_SIZE):
+        self._size = size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=self._size)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        # Never share SQLite handles with a forked child process
+        if self._pid != os.getpid():
+            self._reset()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = get_db()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = ConnectionPool()
+
+def db_connection():
+    """Borrow a pooled database connection: `with db_connection() as conn:`"""
+    return _pool.connection()
+
 def init_db():
     """Initialize database tables"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Search history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS search_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            search_type TEXT NOT NULL,
-            input_text TEXT NOT NULL,
-            result TEXT NOT NULL,
-            confidence REAL,
-            verification TEXT,
-            reason TEXT,
-            searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Users table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Search history table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS search_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                search_type TEXT NOT NULL,
+                input_text TEXT NOT NULL,
+                result TEXT NOT NULL,
+                confidence REAL,
+                verification TEXT,
+                reason TEXT,
+                searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
+        conn.commit()
+        migrate(conn)
+    check_query_plans()
     print('✓ Database initialized')
 
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    (1, 'index history by user and time', [
+        '''CREATE INDEX IF NOT EXISTS idx_search_history_user_time
+           ON search_history (user_id, searched_at DESC, id DESC)''',
+    ]),
+    # Once added (user_id, search_type) / (user_id, result) indexes for the stats
+    # aggregates, which user_stats (3) replaced; kept empty so versions don't shift
+    (2, 'covering indexes for per-user stats (superseded by user_stats)', []),
+    (3, 'per-user stats rollup maintained on insert/delete', [
+        '''CREATE TABLE IF NOT EXISTS user_stats (
+               user_id INTEGER NOT NULL,
+               search_type TEXT NOT NULL,
+               result TEXT NOT NULL,
+               count INTEGER NOT NULL,
+               PRIMARY KEY (user_id, search_type, result)
+           ) WITHOUT ROWID''',
+        '''INSERT OR REPLACE INTO user_stats (user_id, search_type, result, count)
+           SELECT user_id, search_type, result, COUNT(*)
+           FROM search_history
+           GROUP BY user_id, search_type, result''',
+        # Databases that applied the old migration 2 still have its indexes;
+        # stats are read from user_stats now, so they only slow down inserts
+        'DROP INDEX IF EXISTS idx_search_history_user_type',
+        'DROP INDEX IF EXISTS idx_search_history_user_result',
+    ]),
+    (4, 'incremental auto-vacuum', [
+        # Takes effect on the VACUUM below; afterwards pages freed by pruning
+        # can be returned to the OS with PRAGMA incremental_vacuum
+        'PRAGMA auto_vacuum = INCREMENTAL',
+        'VACUUM',
+    ]),
+]
+
+def migrate(conn):
+    """Apply pending schema migrations"""
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+        print(f'✓ Migration {version} applied: {description}')
+
+# Queries on the request path that must be served from an index
+HOT_QUERIES = {
+    'history': ('''
+        SELECT * FROM search_history
+        WHERE user_id = ?
+        ORDER BY searched_at DESC, id DESC
+        LIMIT ?
+    ''', (0, 50)),
+    'history_page': ('''
+        SELECT * FROM search_history
+        WHERE user_id = ? AND (searched_at, id) < (?, ?)
+        ORDER BY searched_at DESC, id DESC
+        LIMIT ?
+    ''', (0, '', 0, 50)),
+    'stats': ('SELECT search_type, result, count FROM user_stats WHERE user_id = ?', (0,)),
+}
+
+def explain_hot_queries():
+    """Return the EXPLAIN QUERY PLAN details for each hot query"""
+    plans = {}
+    with db_connection() as conn:
+        for name, (sql, params) in HOT_QUERIES.items():
+            plans[name] = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+    return plans
+
+def check_query_plans():
+    """Fail fast if a hot query would scan a whole table or sort it in a temp b-tree"""
+    problems = []
+    for name, details in explain_hot_queries().items():
+        for detail in details:
+            if detail.startswith('SCAN ') or 'TEMP B-TREE' in detail:
+                problems.append(f'{name}: {detail}')
+    if problems:
+        raise RuntimeError('Hot queries are not index-backed: ' + '; '.join(problems))
+
 # User functions
 def create_user(username, email, password):
     """Create a new user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        password_hash = generate_password_hash(password)
-        cursor.execute(
-            'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-            (username, email, password_hash)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
-        return {'success': True, 'user_id': user_id}
-    except sqlite3.IntegrityError as e:
-        conn.close()
-        if 'username' in str(e):
-            return {'success': False, 'error': 'Username already exists'}
-        elif 'email' in str(e):
-            return {'success': False, 'error': 'Email already registered'}
-        return {'success': False, 'error': 'Registration failed'}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            password_hash = generate_password_hash(password)
+            cursor.execute(
+                'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                (username, email, password_hash)
+            )
+            conn.commit()
+            invalidate_user(cursor.lastrowid)
+            return {'success': True, 'user_id': cursor.lastrowid}
+        except sqlite3.IntegrityError as e:
+            if 'username' in str(e):
+                return {'success': False, 'error': 'Username already exists'}
+            elif 'email' in str(e):
+                return {'success': False, 'error': 'Email already registered'}
+            return {'success': False, 'error': 'Registration failed'}
 
 def verify_user(username, password):
     """Verify user credentials"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-    user = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
     
     if user and check_password_hash(user['password_hash'], password):
         return {'success': True, 'user': dict(user)}
     return {'success': False, 'error': 'Invalid username or password'}
 
+_user_cache = TTLCache('user_cache', maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
 def get_user_by_id(user_id):
-    """Get user by ID"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, username, email, created_at FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return dict(user) if user else None
+    """Get user by ID (served from the in-process user cache when fresh)"""
+    user = _user_cache.get(user_id)
+    if user is None:
+        with db_connection() as conn:
+            row = conn.execute('SELECT id, username, email, created_at FROM users WHERE id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        user = dict(row)
+        _user_cache.set(user_id, user)
+    return dict(user)
+
+def invalidate_user(user_id):
+    """Drop a cached user record; call after any change to the users row"""
+    _user_cache.invalidate(user_id)
 
 # Search history functions
 def save_search(user_id, search_type, input_text, result, confidence, verification=None, reason=None):
     """Save a search to history"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO search_history (user_id, search_type, input_text, result, confidence, verification, reason)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, search_type, input_text[:500], result, confidence, verification, reason))
-    conn.commit()
-    conn.close()
+    save_searches([(user_id, search_type, input_text, result, confidence, verification, reason)])
+
+def save_searches(rows):
+    """Save many searches in one transaction
+
+    Each row is (user_id, search_type, input_text, result, confidence, verification, reason).
+    The user_stats rollup is updated in the same transaction.
+    """
+    rows = [(row[0], row[1], row[2][:500]) + tuple(row[3:]) for row in rows]
+    counts = Counter((row[0], row[1], row[3]) for row in rows)
+    with db_connection() as conn:
+        with conn:
+            conn.executemany('''
+                INSERT INTO search_history (user_id, search_type, input_text, result, confidence, verification, reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            _adjust_user_stats(conn, counts)
+
+def _adjust_user_stats(conn, counts):
+    """Add (or with negative counts, subtract) {(user_id, search_type, result): n} to user_stats"""
+    conn.executemany('''
+        INSERT INTO user_stats (user_id, search_type, result, count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, search_type, result) DO UPDATE SET count = count + excluded.count
+    ''', [key + (n,) for key, n in counts.items()])
+    conn.executemany(
+        'DELETE FROM user_stats WHERE user_id = ? AND search_type = ? AND result = ? AND count <= 0',
+        list(counts)
+    )
 
 def get_user_history(user_id, limit=50):
     """Get search history for a user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM search_history 
-        WHERE user_id = ? 
-        ORDER BY searched_at DESC 
-        LIMIT ?
-    ''', (user_id, limit))
-    history = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        history = conn.execute(HOT_QUERIES['history'][0], (user_id, limit)).fetchall()
     return [dict(row) for row in history]
 
+def _history_query(table, user_id, before=None, search_type=None, result=None):
+    """Build the keyset-ordered history query for one history table"""
+    sql = f'SELECT * FROM {table} WHERE user_id = ?'
+    params = [user_id]
+    if before is not None:
+        sql += ' AND (searched_at, id) < (?, ?)'
+        params.extend(before)
+    if search_type:
+        sql += ' AND search_type = ?'
+        params.append(search_type)
+    if result:
+        sql += ' AND result = ?'
+        params.append(result)
+    return sql + ' ORDER BY searched_at DESC, id DESC', params
+
+def _history_tables(conn, include_archived):
+    """Hot table first, then archive months newest to oldest (i.e. newest rows first)"""
+    if not include_archived:
+        return ['search_history']
+    return ['search_history'] + list_archive_tables(conn)
+
+def get_user_history_page(user_id, limit=50, before=None, search_type=None, result=None,
+                          include_archived=False):
+    """Get one page of history, newest first
+
+    before is the (searched_at, id) of the last row of the previous page;
+    paging on that key stays fast however deep the user goes.
+    """
+    rows = []
+    with db_connection() as conn:
+        for table in _history_tables(conn, include_archived):
+            sql, params = _history_query(table, user_id, before, search_type, result)
+            rows.extend(conn.execute(sql + ' LIMIT ?', params + [limit - len(rows)]).fetchall())
+            if len(rows) >= limit:
+                break
+    return [dict(row) for row in rows]
+
+def iter_user_history(user_id, search_type=None, result=None, batch_size=1000, include_archived=False):
+    """Yield all matching history rows, newest first, holding only one batch in memory"""
+    with db_connection() as conn:
+        for table in _history_tables(conn, include_archived):
+            sql, params = _history_query(table, user_id, None, search_type, result)
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(row)
+            finally:
+                cursor.close()
+
 def get_user_stats(user_id):
-    """Get statistics for a user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Total searches
-    cursor.execute('SELECT COUNT(*) as total FROM search_history WHERE user_id = ?', (user_id,))
-    total = cursor.fetchone()['total']
-    
-    # Searches by type
-    cursor.execute('''
-        SELECT search_type, COUNT(*) as count 
-        FROM search_history 
-        WHERE user_id = ? 
-        GROUP BY search_type
-    ''', (user_id,))
-    by_type = {row['search_type']: row['count'] for row in cursor.fetchall()}
-    
-    # Spam vs Legitimate
-    cursor.execute('''
-        SELECT result, COUNT(*) as count 
-        FROM search_history 
-        WHERE user_id = ? 
-        GROUP BY result
-    ''', (user_id,))
-    by_result = {row['result']: row['count'] for row in cursor.fetchall()}
+    """Get statistics for a user (read from the user_stats rollup)"""
+    with db_connection() as conn:
+        rows = conn.execute(HOT_QUERIES['stats'][0], (user_id,)).fetchall()
     
-    conn.close()
+    by_type = Counter()
+    by_result = Counter()
+    for row in rows:
+        by_type[row['search_type']] += row['count']
+        by_result[row['result']] += row['count']
     return {
-        'total': total,
-        'by_type': by_type,
-        'by_result': by_result
+        'total': sum(by_type.values()),
+        'by_type': dict(by_type),
+        'by_result': dict(by_result)
     }
 
 def delete_history_item(user_id, history_id):
-    """Delete a single history item"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM search_history WHERE id = ? AND user_id = ?', (history_id, user_id))
-    conn.commit()
-    affected = cursor.rowcount
-    conn.close()
-    return affected > 0
+    """Delete a single history item (hot or archived)"""
+    with db_connection() as conn:
+        with conn:
+            for table in _history_tables(conn, include_archived=True):
+                row = conn.execute(
+                    f'SELECT search_type, result FROM {table} WHERE id = ? AND user_id = ?',
+                    (history_id, user_id)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(f'DELETE FROM {table} WHERE id = ?', (history_id,))
+                    _adjust_user_stats(conn, {(user_id, row['search_type'], row['result']): -1})
+                    return True
+        return False
 
 def clear_user_history(user_id):
-    """Clear all history for a user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM search_history WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
-
-# Initialize database on import
-init_db()
+    """Clear all history for a user (hot and archived)"""
+    with db_connection() as conn:
+        with conn:
+            for table in _history_tables(conn, include_archived=True):
+                conn.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM user_stats WHERE user_id = ?', (user_id,))
+
+# user_stats maintenance (the rollup counts archived rows too)
+def _all_history_sql(conn):
+    """UNION ALL of (user_id, search_type, result) over hot and archive tables"""
+    return ' UNION ALL '.join(
+        f'SELECT user_id, search_type, result FROM {table}'
+        for table in _history_tables(conn, include_archived=True)
+    )
+
+def rebuild_user_stats():
+    """Recompute the user_stats rollup from search_history and its archives"""
+    with db_connection() as conn:
+        with conn:
+            conn.execute('DELETE FROM user_stats')
+            conn.execute(f'''
+                INSERT INTO user_stats (user_id, search_type, result, count)
+                SELECT user_id, search_type, result, COUNT(*)
+                FROM ({_all_history_sql(conn)})
+                GROUP BY user_id, search_type, result
+            ''')
+            return conn.execute('SELECT COUNT(*) FROM user_stats').fetchone()[0]
+
+def check_user_stats():
+    """Return rollup rows that disagree with the history tables (empty list = consistent)"""
+    with db_connection() as conn:
+        rows = conn.execute(f'''
+            SELECT user_id, search_type, result, SUM(actual) AS actual, SUM(stored) AS stored
+            FROM (
+                SELECT user_id, search_type, result, COUNT(*) AS actual, 0 AS stored
+                FROM ({_all_history_sql(conn)})
+                GROUP BY user_id, search_type, result
+                UNION ALL
+                SELECT user_id, search_type, result, 0, count
+                FROM user_stats
+            )
+            GROUP BY user_id, search_type, result
+            HAVING SUM(actual) != SUM(stored)
+        ''').fetchall()
+    return [dict(row) for row in rows]
+
+# Retention: rows older than the retention window move to per-month archive tables
+ARCHIVE_TABLE_PREFIX = 'search_history_archive_'
+
+def list_archive_tables(conn):
+    """Archive table names, newest month first"""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ORDER BY name DESC",
+        (ARCHIVE_TABLE_PREFIX + '%',)
+    ).fetchall()
+    return [row['name'] for row in rows]
+
+def archive_history(retention_days):
+    """Move search_history rows older than retention_days into monthly archive tables
+
+    Returns the number of rows moved. user_stats is left untouched: it
+    counts a user's lifetime searches, archived or not.
+    """
+    cutoff = f'-{int(retention_days)} days'
+    moved = 0
+    with db_connection() as conn:
+        months = [row[0] for row in conn.execute(
+            "SELECT DISTINCT strftime('%Y_%m', searched_at) FROM search_history "
+            "WHERE searched_at < datetime('now', ?)", (cutoff,)
+        )]
+        for month in months:
+            table = ARCHIVE_TABLE_PREFIX + month
+            with conn:
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INTEGER PRIMARY KEY,
+                        user_id INTEGER NOT NULL,
+                        search_type TEXT NOT NULL,
+                        input_text TEXT NOT NULL,
+                        result TEXT NOT NULL,
+                        confidence REAL,
+                        verification TEXT,
+                        reason TEXT,
+                        searched_at TIMESTAMP
+                    )
+                ''')
+                conn.execute(f'''
+                    CREATE INDEX IF NOT EXISTS idx_{table}_user_time
+                    ON {table} (user_id, searched_at DESC, id DESC)
+                ''')
+                where = "searched_at < datetime('now', ?) AND strftime('%Y_%m', searched_at) = ?"
+                conn.execute(
+                    f'INSERT OR REPLACE INTO {table} (id, user_id, search_type, input_text, result, '
+                    f'confidence, verification, reason, searched_at) '
+                    f'SELECT id, user_id, search_type, input_text, result, confidence, verification, '
+                    f'reason, searched_at FROM search_history WHERE {where}', (cutoff, month)
+                )
+                moved += conn.execute(f'DELETE FROM search_history WHERE {where}', (cutoff, month)).rowcount
+    return moved
+
+def compact_database(max_pages=None):
+    """Return free pages to the OS and truncate the WAL; returns the pages freed"""
+    with db_connection() as conn:
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if max_pages:
+            conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+        else:
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return before - after
+
+# Initialize database on import, except in multiprocessing children (e.g. the
+# OCR pool), which re-import the app as __mp_main__ but never touch the database
+if multiprocessing.parent_process() is None:
+    init_db()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Database maintenance')
+    parser.add_argument('command', choices=['rebuild-stats', 'check-stats', 'archive', 'compact'])
+    parser.add_argument('--days', type=int, default=90, help='retention window for archive')
+    args = parser.parse_args()
+    
+    if args.command == 'rebuild-stats':
+        print(f'✓ user_stats rebuilt ({rebuild_user_stats()} rows)')
+    elif args.command == 'archive':
+        print(f'✓ {archive_history(args.days)} rows older than {args.days} days archived')
+    elif args.command == 'compact':
+        print(f'✓ {compact_database()} free pages released')
+    else:
+        mismatches = check_user_stats()
+        for m in mismatches:
+            print(f"✗ user {m['user_id']} {m['search_type']}/{m['result']}: "
+                  f"history has {m['actual']}, user_stats has {m['stored']}")
+        if mismatches:
+            print(f'{len(mismatches)} inconsistent rows - run: python database.py rebuild-stats')
+            sys.exit(1)
+        print('✓ user_stats is consistent with search_history')
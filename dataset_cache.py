@@ -0,0 +1,127 @@
+"""On-disk cache of preprocessed training data, keyed by source file hashes"""
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent
+CACHE_DIR = BASE / 'cache' / 'datasets'
+
+# Bump when preprocessing changes in a way the hashed code below can't see
+# (e.g. a library upgrade that changes tokenization)
+PREPROCESS_VERSION = '3'
+
+def file_sha256(path):
+    """
+    SHA-256 of a file's content. The digest is remembered in a sidecar next
+    to the cache together with the file's size and mtime, so unchanged files
+    are not re-read on every run.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    sidecar = CACHE_DIR / 'hashes' / f'{hashlib.sha1(str(path).encode()).hexdigest()}.json'
+    try:
+        known = json.loads(sidecar.read_text())
+        if known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+
+    sidecar.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=sidecar.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'path': str(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}, f)
+    os.replace(tmp, sidecar)
+    return sha256
+
+def _code_digest(obj):
+    """SHA-256 of a function's or module's source, or of any other object's repr (e.g. regex tables)"""
+    source = inspect.getsource(obj) if inspect.isfunction(obj) or inspect.ismodule(obj) else repr(obj)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+def dataset_key(name, sources, params, code=()):
+    """Cache key from the source files' contents, preprocessing params and code version"""
+    description = {
+        'name': name,
+        'version': PREPROCESS_VERSION,
+        'params': params,
+        'sources': sorted(file_sha256(path) for path in sources),
+        # Editing any of the preprocessing code (functions, modules, pattern tables) invalidates the cache
+        'code': [_code_digest(obj) for obj in code]
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:32]
+
+def load(name, key):
+    """Cached (arrays dict, tokenizer) for key, or None; numeric arrays are memory-mapped"""
+    entry = CACHE_DIR / f'{name}-{key}'
+    try:
+        meta = json.loads((entry / 'meta.json').read_text())
+        objects = set(meta.get('objects', []))
+        arrays = {
+            # Object arrays (e.g. cleaned texts) are pickled and can't be memory-mapped
+            array: np.load(entry / f'{array}.npy', allow_pickle=True) if array in objects
+            else np.load(entry / f'{array}.npy', mmap_mode='r')
+            for array in meta['arrays']
+        }
+        with open(entry / 'tokenizer.pkl', 'rb') as f:
+            tokenizer = pickle.load(f)
+    except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+        return None
+    return arrays, tokenizer
+
+def save(name, key, arrays, tokenizer):
+    """Store arrays (name -> ndarray) and the fitted tokenizer under key"""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    entry = CACHE_DIR / f'{name}-{key}'
+    # Build in a scratch directory and rename, so readers never see a partial entry
+    tmp = Path(tempfile.mkdtemp(dir=CACHE_DIR, prefix=f'.{name}-'))
+    try:
+        objects = []
+        for array, values in arrays.items():
+            values = np.asarray(values)
+            if values.dtype == object:
+                objects.append(array)
+                np.save(tmp / f'{array}.npy', values, allow_pickle=True)
+            else:
+                np.save(tmp / f'{array}.npy', np.ascontiguousarray(values))
+        with open(tmp / 'tokenizer.pkl', 'wb') as f:
+            pickle.dump(tokenizer, f)
+        (tmp / 'meta.json').write_text(json.dumps({'arrays': list(arrays), 'objects': objects}))
+        # Drop older entries for this dataset; they can never be hit again
+        for old in CACHE_DIR.glob(f'{name}-*'):
+            shutil.rmtree(old, ignore_errors=True)
+        os.replace(tmp, entry)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def cached_dataset(name, sources, params, build, code=(), refresh=False):
+    """
+    Return (arrays, tokenizer) for a dataset, from the cache when the source
+    files, params and preprocessing code are unchanged, else from build()
+    (which must return the same pair) and stored for the next run. code
+    lists the functions, modules and pattern tables build() depends on.
+    """
+    sources = sorted(Path(path) for path in sources)
+    key = dataset_key(name, sources, params, code=(build, *code))
+    if not refresh:
+        cached = load(name, key)
+        if cached is not None:
+            print(f'✓ Using cached {name} dataset ({CACHE_DIR.name}/{name}-{key})')
+            return cached
+
+    arrays, tokenizer = build()
+    save(name, key, arrays, tokenizer)
+    print(f'✓ Cached {name} dataset for the next run')
+    return arrays, tokenizer
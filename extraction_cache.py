@@ -0,0 +1,158 @@
+"""Content-addressed cache of extracted text for repeated uploads"""
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from caching import TTLCache
+from file_extractor import EXTRACTOR_VERSION, OCR_INCOMPLETE_NOTE, open_source
+from runtime_metrics import incr, set_gauge
+
+BASE = Path(__file__).resolve().parent
+CACHE_DIR = BASE / 'cache' / 'extraction'
+MEMORY_ENTRIES = 256                  # extracted texts kept in memory
+DISK_MAX_BYTES = 512 * 1024 * 1024    # on-disk tier size before oldest entries are evicted
+
+def is_failed_extraction(text):
+    """
+    Whether an extractor returned an error or no text: 'Error…',
+    'Unsupported…', or 'No text found…' (which includes the missing-OCR
+    install hint and OCR that failed outright)
+    """
+    return not text or text.startswith(('Error', 'Unsupported', 'No text found'))
+
+def is_cacheable(text):
+    """
+    Only cache complete extraction results. Failures and partial OCR (pages
+    that timed out) may be transient: poppler missing, a broken pool, a
+    loaded machine; the same bytes should be extracted again next time.
+    """
+    if is_failed_extraction(text):
+        return False
+    return not text.rstrip().rsplit('\n', 1)[-1].startswith(OCR_INCOMPLETE_NOTE)
+
+class ExtractionCache:
+    """
+    Two-tier cache of extracted text keyed by SHA-256(extractor version + file bytes).
+
+    The memory tier is an LRU of MEMORY_ENTRIES texts; the disk tier stores one
+    file per key under CACHE_DIR and evicts the least recently used files once
+    it grows past DISK_MAX_BYTES. Hit rate and the upload bytes whose
+    extraction was skipped are reported in the runtime metrics.
+    """
+    def __init__(self, directory=CACHE_DIR, memory_entries=MEMORY_ENTRIES, disk_max_bytes=DISK_MAX_BYTES):
+        self.directory = Path(directory)
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = TTLCache('extraction_cache.memory', maxsize=memory_entries)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._disk_bytes = sum(f.stat().st_size for f in self.directory.glob('*/*.txt'))
+
+    @staticmethod
+    def key_for(stream):
+        """SHA-256 of the extractor version and the stream's bytes; returns (key, size)"""
+        digest = hashlib.sha256(EXTRACTOR_VERSION.encode() + b'\0')
+        size = 0
+        stream.seek(0)
+        while True:
+            chunk = stream.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+        stream.seek(0)
+        return digest.hexdigest(), size
+
+    def _path(self, key):
+        return self.directory / key[:2] / f'{key}.txt'
+
+    def get(self, key):
+        """Cached text for key, or None"""
+        text = self._memory.get(key)
+        if text is not None:
+            return text
+        path = self._path(key)
+        try:
+            text = path.read_text(encoding='utf-8')
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+        except OSError:
+            # Missing, or evicted between the read and the touch: a miss
+            return None
+        self._memory.set(key, text)
+        incr('extraction_cache.disk_hits')
+        return text
+
+    def set(self, key, text):
+        self._memory.set(key, text)
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = text.encode('utf-8')
+        # Write atomically so a concurrent reader never sees a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_bytes += len(data)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently used files until the disk tier is back under 90% of its cap"""
+        with self._lock:
+            files = []
+            for f in self.directory.glob('*/*.txt'):
+                try:
+                    stat = f.stat()
+                except OSError:
+                    # Removed by another worker process meanwhile
+                    continue
+                files.append((stat.st_mtime, stat.st_size, f))
+            files.sort(key=lambda entry: entry[0])
+            total = sum(size for _, size, _ in files)
+            target = self.disk_max_bytes * 0.9
+            for _, size, f in files:
+                if total <= target:
+                    break
+                f.unlink(missing_ok=True)
+                total -= size
+                incr('extraction_cache.disk_evictions')
+            self._disk_bytes = total
+        set_gauge('extraction_cache.disk_bytes', total)
+
+    def _lookup(self, stream):
+        """Hash the stream and look it up, recording hit-rate metrics; returns (key, text)"""
+        key, size = self.key_for(stream)
+        text = self.get(key)
+        with self._lock:
+            self._lookups += 1
+            if text is not None:
+                self._hits += 1
+            hit_rate = self._hits / self._lookups
+        set_gauge('extraction_cache.hit_rate', round(hit_rate, 4))
+        if text is not None:
+            incr('extraction_cache.hits')
+            incr('extraction_cache.bytes_saved', size)
+        else:
+            incr('extraction_cache.misses')
+        return key, text
+
+    def extract(self, source, extract_fn):
+        """Return extract_fn(source), served from the cache when the same bytes were seen before"""
+        with open_source(source) as stream:
+            key, text = self._lookup(stream)
+            if text is None:
+                text = extract_fn(stream)
+                if is_cacheable(text):
+                    self.set(key, text)
+            return text
+
+    def lookup(self, source):
+        """Cached full text for a source, or None (never extracts)"""
+        with open_source(source) as stream:
+            return self._lookup(stream)[1]
@@ -0,0 +1,201 @@
+"""Background extraction jobs: bounded worker pool with per-job time and memory limits"""
+import json
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from extraction_cache import is_failed_extraction
+from runtime_metrics import incr, observe, set_gauge
+
+JOB_WORKERS = 2                        # extractions running at once
+JOB_QUEUE_LIMIT = 32                   # queued + running jobs before new ones are refused
+JOB_TIME_LIMIT = 300                   # seconds per job before its process is killed
+JOB_MEMORY_LIMIT = 2 * 1024 ** 3       # address space per job process (bytes)
+JOB_TTL = 3600                         # seconds a finished job's result is kept
+
+_FINISHED = ('done', 'failed')
+BASE = Path(__file__).resolve().parent
+
+def _read_messages(stream, messages):
+    """Queue each JSON line a job process writes, then None at end of output"""
+    try:
+        for line in stream:
+            try:
+                messages.put(json.loads(line))
+            except ValueError:
+                continue
+    except (OSError, ValueError):
+        pass
+    messages.put(None)
+
+class JobRejected(Exception):
+    """Raised when the job queue is full"""
+
+class ExtractionJob:
+    """State of one extraction job, updated by its worker thread"""
+    def __init__(self, user_id, filename, directory):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.filename = filename
+        self.path = Path(directory) / f'{self.id}.upload'
+        self.status = 'queued'
+        self.pages_done = 0
+        self.pages_total = None
+        self.text = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.version = 0  # bumped on every change, for event streams
+
+    def to_dict(self):
+        job = {
+            'job_id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total
+        }
+        if self.status == 'done':
+            job['text'] = self.text
+        elif self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+class ExtractionJobs:
+    """
+    Runs file extractions off the request path.
+
+    Each job runs in its own extraction_worker process, at most `workers` at a time,
+    with its address space capped at memory_limit and killed after
+    time_limit seconds, so a few large scans cannot starve the web workers
+    or each other. Uploads are saved under directory until their job ends;
+    finished jobs are forgotten after ttl seconds.
+    """
+    def __init__(self, directory, workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT,
+                 time_limit=JOB_TIME_LIMIT, memory_limit=JOB_MEMORY_LIMIT, ttl=JOB_TTL, cache=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.queue_limit = queue_limit
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.ttl = ttl
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extraction-job')
+        self._jobs = {}
+        self._changed = threading.Condition()
+
+    def submit(self, user_id, file, filename):
+        """Save an uploaded FileStorage and queue its extraction; returns the job"""
+        with self._changed:
+            self._expire()
+            active = sum(1 for job in self._jobs.values() if job.status not in _FINISHED)
+            if active >= self.queue_limit:
+                incr('extraction_jobs.rejected')
+                raise JobRejected('Too many extraction jobs in progress, please retry later')
+            job = ExtractionJob(user_id, filename, self.directory)
+            self._jobs[job.id] = job
+        file.save(str(job.path))
+        incr('extraction_jobs.submitted')
+        self._executor.submit(self._run, job)
+        self._report_pending()
+        return job
+
+    def get(self, job_id, user_id):
+        """The user's job with this id, or None"""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job.user_id != user_id:
+                return None
+            return job
+
+    def wait(self, job, version, timeout):
+        """Block until job changes past version (or timeout); returns its current dict and version"""
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.to_dict(), job.version
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _update(self, job, **changes):
+        with self._changed:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.version += 1
+            self._changed.notify_all()
+
+    def _report_pending(self):
+        with self._changed:
+            pending = sum(1 for job in self._jobs.values() if job.status not in _FINISHED)
+        set_gauge('extraction_jobs.pending', pending)
+
+    def _expire(self):
+        """Drop finished jobs older than the TTL (caller holds the lock)"""
+        cutoff = time.time() - self.ttl
+        for job_id in [job.id for job in self._jobs.values() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        start = time.perf_counter()
+        self._update(job, status='running')
+        try:
+            if self.cache is not None:
+                text = self.cache.extract(job.path, lambda stream: self._extract(job))
+            else:
+                text = self._extract(job)
+            if not is_failed_extraction(text):
+                self._update(job, status='done', text=text, finished=time.time())
+                incr('extraction_jobs.completed')
+            else:
+                self._update(job, status='failed', error=text or 'No text could be extracted from the file',
+                             finished=time.time())
+                incr('extraction_jobs.failed')
+        except Exception as e:
+            self._update(job, status='failed', error=f'Error extracting text: {e}', finished=time.time())
+            incr('extraction_jobs.failed')
+        finally:
+            job.path.unlink(missing_ok=True)
+            observe('extraction_jobs.run_ms', (time.perf_counter() - start) * 1000)
+            self._report_pending()
+
+    def _extract(self, job):
+        """Run the extraction in a child process, enforcing the time limit; returns its text"""
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'extraction_worker', str(job.path), str(self.memory_limit)],
+            cwd=str(BASE), stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True, encoding='utf-8'
+        )
+        # Read its JSON lines on a thread, so waiting for them can time out
+        messages = queue.Queue()
+        reader = threading.Thread(target=_read_messages, args=(process.stdout, messages),
+                                  name=f'extraction-job-{job.id[:8]}', daemon=True)
+        reader.start()
+        deadline = time.monotonic() + self.time_limit
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    incr('extraction_jobs.timeouts')
+                    return f'Error: extraction took longer than {self.time_limit}s and was stopped'
+                try:
+                    message = messages.get(timeout=min(remaining, 0.5))
+                except queue.Empty:
+                    continue
+                if message is None:
+                    # Output ended without a result
+                    process.wait(5)
+                    incr('extraction_jobs.crashed')
+                    return f'Error: extraction process exited unexpectedly (code {process.returncode})'
+                if 'progress' in message:
+                    self._update(job, pages_done=message['progress'][0], pages_total=message['progress'][1])
+                else:
+                    return message.get('done', message.get('failed'))
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait(5)
+            process.stdout.close()
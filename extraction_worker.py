@@ -0,0 +1,48 @@
+"""
+Extraction job process (see extraction_jobs.ExtractionJobs).
+
+    python -m extraction_worker <path> <memory_limit_bytes>
+
+Runs as a plain subprocess rather than a multiprocessing child, so it
+imports only file_extractor: multiprocessing would re-run the web app's
+main module (Flask, the models' libraries, database migrations) in every
+job before the memory limit applies. Progress and the result are written
+to stdout as JSON lines ({"progress": [done, total]}, then {"done": text}
+or {"failed": error}); anything else the extractor prints goes to stderr.
+"""
+import json
+import os
+import sys
+
+def _set_memory_limit(memory_limit):
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except (ImportError, ValueError, OSError):
+        # No RLIMIT_AS on this platform; the time limit still applies
+        pass
+
+def main(path, memory_limit):
+    # Keep stdout for messages; send everything else (prints, C libraries) to stderr
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(**message):
+        out.write(json.dumps(message) + '\n')
+        out.flush()
+
+    _set_memory_limit(memory_limit)
+    try:
+        import file_extractor
+        # The job is the unit of parallelism: OCR its pages in this process
+        file_extractor.OCR_WORKERS = 1
+        text = file_extractor.extract_text_from_file(
+            path, progress=lambda done, total: send(progress=[done, total]))
+        send(done=text)
+    except MemoryError:
+        send(failed='Error: file needs more memory than an extraction job is allowed')
+    except Exception as e:
+        send(failed=f'Error extracting text: {e}')
+
+if __name__ == '__main__':
+    main(sys.argv[1], int(sys.argv[2]))
@@ -1,6 +1,18 @@
 """File Upload and Text Extraction Utility"""
+import io
+import multiprocessing
 import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from pathlib import Path
+import numpy as np
 from PIL import Image
 import pytesseract
 from docx import Document
@@ -20,7 +32,7 @@ if os.name == 'nt':  # Windows
 
 # Try to import pdf2image for OCR on scanned PDFs
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     PDF2IMAGE_AVAILABLE = True
     
     # Configure Poppler path for Windows
@@ -40,32 +52,388 @@ except ImportError:
     PDF2IMAGE_AVAILABLE = False
     POPPLER_PATH = None
 
-def extract_text_from_image(file_path):
-    """Extract text from image using OCR"""
+# Bump when a change alters extracted text, so cached extractions are not reused
+EXTRACTOR_VERSION = '3'
+
+# OCR preprocessing: rescale so text lines are about OCR_TARGET_LINE_HEIGHT px
+# tall (Tesseract is fastest and most accurate around there), grayscale,
+# binarize and crop blank margins before handing the image to Tesseract
+OCR_PREPROCESS = True
+OCR_TARGET_LINE_HEIGHT = 40
+OCR_MAX_PIXELS = 12_000_000   # never upscale beyond this
+# Line height estimates from fewer ink runs, or taller than this fraction of the
+# image, come from bars, borders or photos rather than text: keep the size
+OCR_MIN_LINE_RUNS = 2
+OCR_MAX_LINE_FRACTION = 0.5
+OCR_PROBE_DPI = 72            # scanned PDFs: low-res render used to pick the real DPI
+OCR_MIN_DPI = 100
+OCR_MAX_DPI = 300
+
+# Scanned-PDF OCR: pages are rendered and OCR'd one at a time in a pool of
+# worker processes, so memory scales with OCR_WORKERS rather than page count
+OCR_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+OCR_PAGE_TIMEOUT = 30  # seconds allowed to render + OCR one page (probe, render and Tesseract together)
+OCR_PAGE_GRACE = 5     # extra seconds the caller waits on a running pooled page before giving up on it
+OCR_DPI = 150
+OCR_INCOMPLETE_NOTE = '[OCR incomplete:'  # starts the last line of PDF text when OCR skipped pages
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+@contextmanager
+def open_source(source):
+    """
+    Yield a seekable binary stream for a path, bytes or file-like object.
+    File-like objects are rewound first and are not closed afterwards.
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as stream:
+            yield stream
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+    else:
+        source.seek(0)
+        yield source
+
+def read_head(stream, size=4096):
+    """Read the first bytes of a stream without moving its position"""
+    position = stream.tell()
+    head = stream.read(size)
+    stream.seek(position)
+    return head
+
+EML_SNIFF_BYTES = 64 * 1024  # header blocks with long signatures run well past read_head's default
+# Any RFC 5322 header field line: printable name without spaces or ':', then ':'
+_HEADER_FIELD = re.compile(rb'([!-9;-~]+):')
+# Fields that mark a header block as an email's rather than "Key: value" notes,
+# which can share the generic ones (Date, Sender, Content-Type, ...)
+_EMAIL_FIELDS = {b'from', b'to', b'subject', b'received', b'message-id'}
+
+def _is_email_header(head, limit=EML_SNIFF_BYTES):
+    """
+    Whether the head of a text file opens with an email header block: an
+    optional mbox 'From ' line, then at least two header field lines (folded
+    continuation lines allowed) up to the first blank line, including one of
+    From/To/Subject/Received/Message-ID.
+    """
+    lines = head.lstrip().splitlines()
+    if lines and lines[0].startswith(b'From '):
+        lines = lines[1:]
+    # A head that fills the limit may stop mid-line (e.g. inside a long DKIM signature)
+    truncated = len(head) >= limit
+    names = []
+    for i, line in enumerate(lines):
+        if not line.strip():
+            truncated = False
+            break
+        if line[:1] in (b' ', b'\t'):
+            if not names:
+                return False
+            continue
+        match = _HEADER_FIELD.match(line)
+        if not match:
+            if truncated and i == len(lines) - 1:
+                break
+            return False
+        names.append(match.group(1).lower())
+    # A block cut off by the head may not reach its second field (huge Received/signature lines)
+    return len(names) >= (1 if truncated else 2) and any(name in _EMAIL_FIELDS for name in names)
+
+# DIB header sizes: BITMAPCOREHEADER, BITMAPINFOHEADER, V2, V3, V4, V5
+_BMP_DIB_SIZES = {12, 40, 52, 56, 108, 124}
+
+def _is_bmp(head):
+    """Whether head is a BMP file header (not just text that starts with 'BM')"""
+    if len(head) < 18 or not head.startswith(b'BM'):
+        return False
+    file_size, reserved, _, dib_size = struct.unpack_from('<IIII', head, 2)
+    return file_size >= 14 + 12 and reserved == 0 and dib_size in _BMP_DIB_SIZES
+
+def detect_file_type(stream):
+    """
+    Identify an upload from its magic bytes rather than its extension.
+    Returns 'pdf', 'docx', 'doc', 'image', 'eml', 'txt' or None.
+    """
+    head = read_head(stream)
+    if b'%PDF-' in head[:1024]:
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        try:
+            position = stream.tell()
+            names = zipfile.ZipFile(stream).namelist()
+            stream.seek(position)
+        except zipfile.BadZipFile:
+            return None
+        return 'docx' if 'word/document.xml' in names else None
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'doc'
+    if (head.startswith((b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a',
+                         b'II*\x00', b'MM\x00*'))
+            or _is_bmp(head)
+            or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')):
+        return 'image'
+    if b'\x00' in head:
+        return None
+    # Plain text: an email if it opens with an RFC 5322 header block
+    if _is_email_header(read_head(stream, EML_SNIFF_BYTES)):
+        return 'eml'
+    return 'txt'
+
+def _otsu_threshold(pixels):
+    """Otsu's threshold for an array of 8-bit grayscale pixels"""
+    hist = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    cum_mean = np.cumsum(hist * np.arange(256))
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+def estimate_line_height(ink):
+    """
+    Median height in pixels of the text lines in a boolean ink mask, or None
+    when the rows don't look like separate lines of text (e.g. a dark scanner
+    edge or sidebar puts ink in every row)
+    """
+    rows = ink.mean(axis=1) > 0.002
+    # Lengths of consecutive runs of rows containing ink
+    edges = np.diff(np.concatenate(([0], rows.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    heights = ends - starts
+    heights = heights[heights >= 3]
+    if len(heights) < OCR_MIN_LINE_RUNS:
+        return None
+    height = float(np.median(heights))
+    return height if height <= OCR_MAX_LINE_FRACTION * ink.shape[0] else None
+
+def _to_grayscale(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert('L')
+
+def preprocess_for_ocr(image):
+    """
+    Prepare an image for Tesseract: grayscale, rescale to the target text
+    size, binarize (Otsu) with dark text on white, and crop blank margins.
+    """
+    gray = _to_grayscale(image)
+    pixels = np.asarray(gray)
+    threshold = _otsu_threshold(pixels)
+    ink = pixels < threshold
+    # Light text on a dark background (dark-mode screenshots): flip it
+    if ink.mean() > 0.5:
+        ink = ~ink
+        gray = Image.fromarray(255 - pixels)
+        pixels = np.asarray(gray)
+        threshold = 255 - threshold
+    
+    # Crop blank margins (keep a small border for Tesseract)
+    rows, cols = np.flatnonzero(ink.any(axis=1)), np.flatnonzero(ink.any(axis=0))
+    if len(rows) and len(cols):
+        pad = 10
+        box = (max(cols[0] - pad, 0), max(rows[0] - pad, 0),
+               min(cols[-1] + pad + 1, gray.width), min(rows[-1] + pad + 1, gray.height))
+        gray = gray.crop(box)
+        ink = ink[box[1]:box[3], box[0]:box[2]]
+    
+    line_height = estimate_line_height(ink)
+    if line_height:
+        scale = OCR_TARGET_LINE_HEIGHT / line_height
+        max_scale = (OCR_MAX_PIXELS / max(gray.width * gray.height, 1)) ** 0.5
+        scale = min(max(scale, 0.25), 4.0, max_scale)
+        if abs(scale - 1) > 0.15:
+            size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+            gray = gray.resize(size, Image.LANCZOS)
+    
+    return gray.point(lambda value: 255 if value >= threshold else 0, mode='1')
+
+def ocr_image(image, timeout=0):
+    """Run Tesseract on an image, preprocessing it first when OCR_PREPROCESS is on"""
+    if OCR_PREPROCESS:
+        image = preprocess_for_ocr(image)
+    return pytesseract.image_to_string(image, timeout=timeout)
+
+def extract_text_from_image(source):
+    """Extract text from image using OCR (source: path, bytes or file-like)"""
     try:
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
+        with open_source(source) as stream:
+            image = Image.open(stream)
+            image.load()
+        text = ocr_image(image)
         return text.strip() if text.strip() else "No text found in image (OCR returned empty result)"
     except Exception as e:
         return f"Error extracting text from image: {str(e)}"
 
-def ocr_pdf_pages(file_path, max_pages=10):
-    """Extract text from scanned PDF using OCR"""
+def _get_ocr_pool():
+    """Shared OCR process pool, created on first use"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # spawn: never fork a multi-threaded web server process
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _ocr_pool
+
+def _reset_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+class OCRPageTimeout(RuntimeError):
+    """A page used up its OCR_PAGE_TIMEOUT budget"""
+
+def _remaining(deadline):
+    """Seconds left before deadline (time.monotonic()); raises OCRPageTimeout when none are"""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise OCRPageTimeout('page timed out')
+    return left
+
+def _render_pdf_page(pdf_path, page_number, dpi, timeout):
+    options = {'first_page': page_number, 'last_page': page_number, 'dpi': dpi, 'timeout': timeout}
+    if POPPLER_PATH:
+        options['poppler_path'] = POPPLER_PATH
+    images = convert_from_path(pdf_path, **options)
+    return images[0] if images else None
+
+def _pick_render_dpi(pdf_path, page_number, deadline):
+    """Choose a DPI that puts the page's text near OCR_TARGET_LINE_HEIGHT, from a low-res probe"""
+    probe = _render_pdf_page(pdf_path, page_number, OCR_PROBE_DPI, _remaining(deadline))
+    if probe is None:
+        return OCR_DPI
+    pixels = np.asarray(_to_grayscale(probe))
+    line_height = estimate_line_height(pixels < _otsu_threshold(pixels))
+    if not line_height:
+        return OCR_DPI
+    dpi = OCR_PROBE_DPI * OCR_TARGET_LINE_HEIGHT / line_height
+    return int(min(max(dpi, OCR_MIN_DPI), OCR_MAX_DPI))
+
+def _ocr_pdf_page(pdf_path, page_number, dpi=None, timeout=OCR_PAGE_TIMEOUT):
+    """Render one PDF page and OCR it (runs in an OCR worker process)
+
+    dpi=None picks the render resolution from the page's text size when
+    OCR_PREPROCESS is on, and uses OCR_DPI otherwise. timeout covers the
+    whole page: each step only gets the time the previous ones left.
+    """
+    deadline = time.monotonic() + timeout
+    if dpi is None:
+        dpi = _pick_render_dpi(pdf_path, page_number, deadline) if OCR_PREPROCESS else OCR_DPI
+    image = _render_pdf_page(pdf_path, page_number, dpi, _remaining(deadline))
+    if image is None:
+        return ''
+    return ocr_image(image, timeout=_remaining(deadline))
+
+@contextmanager
+def _pdf_path(source):
+    """Yield a filesystem path for a PDF source, writing in-memory data to a temp file"""
+    if isinstance(source, (str, Path)):
+        yield str(source)
+        return
+    with open_source(source) as stream:
+        handle = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        try:
+            with handle:
+                while True:
+                    chunk = stream.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    handle.write(chunk)
+            yield handle.name
+        finally:
+            os.remove(handle.name)
+
+def _wait_for_page(future, page_timeout):
+    """
+    Result of a pooled page. The worker enforces page_timeout itself, so
+    only a page that has been running for longer than that plus
+    OCR_PAGE_GRACE is given up on; time spent queued behind other requests'
+    pages doesn't count.
+    """
+    started = None
+    while True:
+        try:
+            return future.result(timeout=1)
+        except FutureTimeout:
+            if not future.running():
+                continue
+            started = started or time.monotonic()
+            if time.monotonic() - started > page_timeout + OCR_PAGE_GRACE:
+                raise
+
+def iter_ocr_pdf_pages(pdf_path, max_pages=10, workers=None, page_timeout=OCR_PAGE_TIMEOUT, progress=None,
+                       skipped=None):
+    """
+    Yield (page_number, text) for the first max_pages pages of a PDF, in page order.
+
+    With workers > 1, at most `workers` pages are in flight at once on the
+    shared process pool; workers=1 renders and OCRs in the calling process.
+    A page that exceeds page_timeout or fails to render/OCR is skipped, and
+    its number appended to `skipped` if a list is given. progress, if given,
+    is called as progress(pages_done, pages_total) after each page.
+    """
+    info_options = {'poppler_path': POPPLER_PATH} if POPPLER_PATH else {}
+    page_count = min(max_pages, int(pdfinfo_from_path(pdf_path, **info_options)['Pages']))
+    workers = OCR_WORKERS if workers is None else workers
+    
+    if workers <= 1:
+        for page_number in range(1, page_count + 1):
+            try:
+                yield page_number, _ocr_pdf_page(pdf_path, page_number, timeout=page_timeout)
+            except Exception as e:  # e.g. PDFPopplerTimeoutError, or pytesseract's RuntimeError
+                print(f"OCR page {page_number} skipped: {e!r}")
+                if skipped is not None:
+                    skipped.append(page_number)
+            if progress:
+                progress(page_number, page_count)
+        return
+    
+    pool = _get_ocr_pool()
+    pending = []
+    next_page = 1
+    try:
+        while pending or next_page <= page_count:
+            # Keep the window full: one page in flight per worker
+            while next_page <= page_count and len(pending) < workers:
+                pending.append((next_page, pool.submit(_ocr_pdf_page, pdf_path, next_page, None, page_timeout)))
+                next_page += 1
+            page_number, future = pending.pop(0)
+            try:
+                yield page_number, _wait_for_page(future, page_timeout)
+            except BrokenProcessPool:
+                raise
+            except Exception as e:  # the page's own timeout or render/OCR error
+                future.cancel()
+                print(f"OCR page {page_number} skipped: {e!r}")
+                if skipped is not None:
+                    skipped.append(page_number)
+            if progress:
+                progress(page_number, page_count)
+    except BrokenProcessPool:
+        _reset_ocr_pool()
+        raise
+    finally:
+        # Early exit (error or caller stopped iterating): drop queued pages
+        for _, future in pending:
+            future.cancel()
+
+def ocr_pdf_pages(source, max_pages=10, workers=None, progress=None, skipped=None):
+    """Extract text from scanned PDF using OCR (source: path, bytes or file-like; skipped: see iter_ocr_pdf_pages)"""
     if not PDF2IMAGE_AVAILABLE:
         return None
     
     try:
-        # Convert PDF pages to images (limit pages for performance)
-        if POPPLER_PATH:
-            images = convert_from_path(file_path, first_page=1, last_page=max_pages, dpi=150, poppler_path=POPPLER_PATH)
-        else:
-            images = convert_from_path(file_path, first_page=1, last_page=max_pages, dpi=150)
-        
         text_parts = []
-        for i, image in enumerate(images):
-            page_text = pytesseract.image_to_string(image)
-            if page_text.strip():
-                text_parts.append(f"--- Page {i+1} ---\n{page_text.strip()}")
+        with _pdf_path(source) as pdf_path:
+            for page_number, page_text in iter_ocr_pdf_pages(pdf_path, max_pages, workers, progress=progress,
+                                                             skipped=skipped):
+                if page_text.strip():
+                    text_parts.append(f"--- Page {page_number} ---\n{page_text.strip()}")
         
         if text_parts:
             return "\n\n".join(text_parts)
@@ -74,11 +442,15 @@ def ocr_pdf_pages(file_path, max_pages=10):
         print(f"OCR PDF error: {e}")
         return None
 
-def extract_text_from_pdf(file_path):
-    """Extract text from PDF file (with OCR fallback for scanned PDFs)"""
+def extract_text_from_pdf(source, progress=None):
+    """Extract text from PDF file (with OCR fallback for scanned PDFs)
+
+    progress, if given, is called as progress(pages_done, pages_total) as
+    pages are read, and again per page if the OCR fallback runs.
+    """
     try:
         text = ""
-        with open(file_path, 'rb') as file:
+        with open_source(source) as file:
             try:
                 pdf_reader = PyPDF2.PdfReader(file)
             except Exception as e:
@@ -99,16 +471,23 @@ def extract_text_from_pdf(file_path):
                         text += page_text + "\n"
                 except Exception as page_error:
                     # Skip problematic pages
-                    continue
+                    pass
+                if progress:
+                    progress(i + 1, max_pages)
             
             if max_pages < len(pdf_reader.pages):
                 text += f"\n[Note: Only first {max_pages} of {len(pdf_reader.pages)} pages extracted]"
         
         # If no text found, try OCR
         if not text.strip():
-            ocr_text = ocr_pdf_pages(file_path)
+            skipped = []
+            ocr_text = ocr_pdf_pages(source, progress=progress, skipped=skipped)
             if ocr_text:
-                return ocr_text + "\n\n[Extracted via OCR from scanned PDF]"
+                ocr_text += "\n\n[Extracted via OCR from scanned PDF]"
+                if skipped:
+                    # Last line, so callers (e.g. the extraction cache) can tell the text is partial
+                    ocr_text += f"\n{OCR_INCOMPLETE_NOTE} pages {', '.join(map(str, skipped))} failed or timed out]"
+                return ocr_text
             else:
                 if PDF2IMAGE_AVAILABLE:
                     return "No text found in PDF. OCR also failed - the PDF may be empty or unreadable."
@@ -119,10 +498,11 @@ def extract_text_from_pdf(file_path):
     except Exception as e:
         return f"Error extracting text from PDF: {str(e)}"
 
-def extract_text_from_docx(file_path):
+def extract_text_from_docx(source):
     """Extract text from DOCX file"""
     try:
-        doc = Document(file_path)
+        with open_source(source) as stream:
+            doc = Document(stream)
         text_parts = []
         
         # Extract text from paragraphs
@@ -142,31 +522,32 @@ def extract_text_from_docx(file_path):
     except Exception as e:
         return f"Error extracting text from DOCX: {str(e)}"
 
-def extract_text_from_txt(file_path):
+def extract_text_from_txt(source):
     """Extract text from TXT file"""
     try:
+        with open_source(source) as stream:
+            raw = stream.read()
         # Try multiple encodings
         encodings = ['utf-8', 'latin-1', 'cp1252', 'ascii']
         for encoding in encodings:
             try:
-                with open(file_path, 'r', encoding=encoding, errors='ignore') as file:
-                    text = file.read().strip()
-                    if text:
-                        return text
+                text = raw.decode(encoding, errors='ignore').strip()
+                if text:
+                    return text
             except:
                 continue
         return "No text found in file"
     except Exception as e:
         return f"Error reading text file: {str(e)}"
 
-def extract_text_from_eml(file_path):
+def extract_text_from_eml(source):
     """Extract text from email (.eml) file"""
     try:
         import email
         from email import policy
         from email.parser import BytesParser
         
-        with open(file_path, 'rb') as file:
+        with open_source(source) as file:
             msg = BytesParser(policy=policy.default).parse(file)
         
         text_parts = []
@@ -196,27 +577,210 @@ def extract_text_from_eml(file_path):
         return text.strip() if text.strip() else "No text found in email file"
     except Exception as e:
         # Fallback to reading as text
-        return extract_text_from_txt(file_path)
+        return extract_text_from_txt(source)
 
-def extract_text_from_file(file_path):
+def extract_text_from_file(source, progress=None):
     """
     Extract text from various file types
-    Supports: Images (JPG, PNG), PDF, DOCX, TXT, EML
+    Supports: Images (JPG, PNG, GIF, BMP, TIFF, WEBP), PDF, DOCX, TXT, EML
+
+    source may be a path, bytes or a binary file-like object (e.g. an
+    upload stream); the type is detected from the content's magic bytes.
+    progress(pages_done, pages_total) is reported for PDFs.
     """
-    file_ext = Path(file_path).suffix.lower()
+    with open_source(source) as stream:
+        file_type = detect_file_type(stream)
+        
+        if file_type == 'image':
+            return extract_text_from_image(stream)
+        elif file_type == 'pdf':
+            return extract_text_from_pdf(stream, progress=progress)
+        elif file_type == 'docx':
+            return extract_text_from_docx(stream)
+        elif file_type == 'doc':
+            # .doc files are not supported by python-docx
+            return "Error: Old .doc format not supported. Please convert to .docx or .txt"
+        elif file_type == 'txt':
+            return extract_text_from_txt(stream)
+        elif file_type == 'eml':
+            return extract_text_from_eml(stream)
+        else:
+            return "Unsupported file type: content is not a recognised image, PDF, DOCX, TXT or EML file"
+
+# ========== STREAMING EXTRACTION ==========
+# Yield text part by part (page, paragraph, MIME part, chunk) so callers that
+# only need the beginning of a document - the classifiers read the first
+# maxlen tokens - can stop early instead of extracting everything.
+
+# Tokens to extract for classification by default: one 150-token email window
+# (the app passes a larger budget when it scores several windows)
+CLASSIFY_TOKEN_BUDGET = 150
+
+class UnsupportedFileType(ValueError):
+    """Raised when an upload's content matches no supported format"""
+
+def iter_text_from_image(source):
+    """Yield the OCR text of an image"""
+    with open_source(source) as stream:
+        image = Image.open(stream)
+        image.load()
+    text = ocr_image(image).strip()
+    if text:
+        yield text
+
+def iter_text_from_pdf(source, max_pages=50):
+    """Yield PDF text page by page, falling back to page-by-page OCR for scanned PDFs"""
+    found_text = False
+    with open_source(source) as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for i in range(min(len(pdf_reader.pages), max_pages)):
+            try:
+                page_text = pdf_reader.pages[i].extract_text()
+            except Exception:
+                # Skip problematic pages
+                continue
+            if page_text and page_text.strip():
+                found_text = True
+                yield page_text
     
-    if file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif']:
-        return extract_text_from_image(file_path)
-    elif file_ext == '.pdf':
-        return extract_text_from_pdf(file_path)
-    elif file_ext == '.docx':
-        return extract_text_from_docx(file_path)
-    elif file_ext == '.doc':
-        # .doc files are not supported by python-docx, try reading as binary text
-        return "Error: Old .doc format not supported. Please convert to .docx or .txt"
-    elif file_ext == '.txt':
-        return extract_text_from_txt(file_path)
-    elif file_ext == '.eml':
-        return extract_text_from_eml(file_path)
-    else:
-        return f"Unsupported file type: {file_ext}"
+    if not found_text and PDF2IMAGE_AVAILABLE:
+        with _pdf_path(source) as pdf_path:
+            for page_number, page_text in iter_ocr_pdf_pages(pdf_path):
+                if page_text.strip():
+                    yield f"--- Page {page_number} ---\n{page_text.strip()}"
+
+def iter_text_from_docx(source):
+    """Yield DOCX paragraphs, then table rows"""
+    with open_source(source) as stream:
+        doc = Document(stream)
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            yield paragraph.text
+    for table in doc.tables:
+        for row in table.rows:
+            row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if row_text:
+                yield " | ".join(row_text)
+
+def iter_text_from_txt(source, chunk_size=8 * 1024):
+    """Yield a text file in decoded chunks"""
+    import codecs
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    with open_source(source) as stream:
+        while True:
+            raw = stream.read(chunk_size)
+            text = decoder.decode(raw, final=not raw)
+            if text:
+                yield text
+            if not raw:
+                break
+
+def iter_text_from_eml(source):
+    """Yield the subject/from headers and each text/plain part of an email"""
+    from email import policy
+    from email.parser import BytesParser
+    
+    with open_source(source) as file:
+        msg = BytesParser(policy=policy.default).parse(file)
+    
+    if msg['subject']:
+        yield f"Subject: {msg['subject']}"
+    if msg['from']:
+        yield f"From: {msg['from']}"
+    parts = msg.walk() if msg.is_multipart() else [msg]
+    for part in parts:
+        if part.get_content_type() == 'text/plain' or not msg.is_multipart():
+            body = part.get_content()
+            if body:
+                yield body
+
+def iter_text_from_file(source):
+    """Yield the text of any supported file part by part (type from magic bytes)"""
+    with open_source(source) as stream:
+        file_type = detect_file_type(stream)
+        iterators = {
+            'image': iter_text_from_image,
+            'pdf': iter_text_from_pdf,
+            'docx': iter_text_from_docx,
+            'txt': iter_text_from_txt,
+            'eml': iter_text_from_eml,
+        }
+        if file_type not in iterators:
+            raise UnsupportedFileType('Unsupported file type: content is not a recognised image, PDF, DOCX, TXT or EML file')
+        yield from iterators[file_type](stream)
+
+def extract_text_for_classification(source, token_budget=CLASSIFY_TOKEN_BUDGET):
+    """
+    Extract only as much text as the classifier will read.
+
+    Returns (text, truncated): extraction stops at the first part that brings
+    the cleaned token count to token_budget; truncated says whether the
+    document may continue beyond the returned text. Errors are returned as
+    text starting with 'Error', like extract_text_from_file.
+    """
+    from ml_utils import clean_text
+    
+    parts = []
+    tokens = 0
+    parts_iter = iter_text_from_file(source)
+    try:
+        for part in parts_iter:
+            parts.append(part)
+            tokens += len(clean_text(part).split())
+            if tokens >= token_budget:
+                return "\n".join(parts).strip(), True
+    except UnsupportedFileType as e:
+        return str(e), False
+    except Exception as e:
+        return f"Error extracting text: {str(e)}", False
+    finally:
+        # Stops pending OCR pages and closes the source
+        parts_iter.close()
+    
+    text = "\n".join(parts).strip()
+    return (text if text else "No text found in file"), False
+
+# ========== LINK EXTRACTION ==========
+
+MAX_LINKS = 100  # links scored per document
+
+_URL_PATTERN = re.compile(r'(?:https?://|www\.)[^\s<>"\'\)\]\}]+', re.IGNORECASE)
+_HREF_PATTERN = re.compile(r'href\s*=\s*["\']?([^"\'\s>]+)', re.IGNORECASE)
+
+def extract_urls_from_text(text):
+    """URLs found in free text, in order of appearance (may repeat)"""
+    return [url.rstrip('.,;:!?\'"') for url in _URL_PATTERN.findall(text or '')]
+
+def _iter_eml_urls(source):
+    """URLs from every text part of an email, including HTML hrefs"""
+    from email import policy
+    from email.parser import BytesParser
+    
+    with open_source(source) as file:
+        msg = BytesParser(policy=policy.default).parse(file)
+    for part in msg.walk():
+        if part.get_content_maintype() != 'text':
+            continue
+        try:
+            body = part.get_content()
+        except Exception:
+            continue
+        if part.get_content_subtype() == 'html':
+            yield from (url for url in _HREF_PATTERN.findall(body) if url.lower().startswith(('http', 'www.')))
+        yield from extract_urls_from_text(body)
+
+def extract_links(source, text, max_links=MAX_LINKS):
+    """
+    Unique links in a document: every URL in the extracted text plus, for
+    emails, every URL and href in all text/plain and text/html parts.
+    """
+    urls = extract_urls_from_text(text)
+    try:
+        with open_source(source) as stream:
+            if detect_file_type(stream) == 'eml':
+                urls.extend(_iter_eml_urls(stream))
+    except Exception as e:
+        print(f"Link extraction error: {e}")
+    
+    links = list(dict.fromkeys(urls))
+    return links[:max_links]
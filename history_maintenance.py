@@ -0,0 +1,53 @@
+"""Background retention job: archive old history and compact the database"""
+import threading
+import time
+
+from database import archive_history, compact_database
+from runtime_metrics import incr, observe, set_gauge
+
+class HistoryMaintenance:
+    """
+    Periodically move search_history rows older than retention_days into
+    monthly archive tables, then release freed pages with incremental vacuum.
+    The hot table therefore only ever holds the retention window.
+    """
+    def __init__(self, retention_days=90, interval=3600, vacuum_pages=None):
+        self.retention_days = retention_days
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the maintenance thread (idempotent; no-op when retention is disabled)"""
+        if not self.retention_days:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='history-maintenance', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """Archive and compact once; returns (rows archived, pages freed)"""
+        start = time.perf_counter()
+        archived = archive_history(self.retention_days)
+        freed = compact_database(self.vacuum_pages)
+        observe('history_maintenance.run_ms', (time.perf_counter() - start) * 1000)
+        incr('history_maintenance.rows_archived', archived)
+        incr('history_maintenance.pages_freed', freed)
+        set_gauge('history_maintenance.last_run', time.time())
+        return archived, freed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                incr('history_maintenance.errors')
+                print(f'History maintenance error: {e}')
+            self._stop.wait(self.interval)
@@ -0,0 +1,142 @@
+"""Write-behind search history writer with batched inserts"""
+import queue
+import threading
+import time
+
+from database import save_searches
+from runtime_metrics import incr, observe, set_gauge
+
+# What submit() does when the queue is full
+ON_FULL_POLICIES = ('block', 'drop', 'sync')
+
+_STOP = object()
+
+class _FlushMarker:
+    """Queued behind pending rows; set once everything before it is written"""
+    def __init__(self):
+        self.done = threading.Event()
+
+class HistoryWriter:
+    """
+    Take history rows from request handlers through a bounded queue and write
+    them from a background thread, one transaction per batch.
+
+    A batch is written when it reaches batch_size rows or flush_interval
+    seconds after its first row, whichever comes first. When the queue is
+    full, on_full decides what happens to a new row:
+        'block' - wait up to put_timeout seconds, then write it synchronously
+        'drop'  - discard it (counted in history_writer.dropped)
+        'sync'  - write it synchronously in the calling request
+    """
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval=0.5,
+                 on_full='block', put_timeout=1.0):
+        if on_full not in ON_FULL_POLICIES:
+            raise ValueError(f'on_full must be one of {ON_FULL_POLICIES}, got {on_full!r}')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background writer thread (idempotent)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id, search_type, input_text, result, confidence, verification=None, reason=None):
+        """Queue one search for writing; same arguments as database.save_search"""
+        self.start()
+        row = (user_id, search_type, input_text, result, confidence, verification, reason)
+        try:
+            if self.on_full == 'block':
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            incr('history_writer.queue_full')
+            if self.on_full == 'drop':
+                incr('history_writer.dropped')
+                return False
+            incr('history_writer.sync_writes')
+            self._write([row])
+        set_gauge('history_writer.queue_depth', self._queue.qsize())
+        return True
+
+    def flush(self, timeout=5.0):
+        """Block until every row submitted so far has been written"""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        marker = _FlushMarker()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout=10.0):
+        """Write everything still queued and stop the writer thread"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, markers = [], []
+            stop = self._collect(item, batch, markers)
+            if not stop:
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size and not markers:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if self._collect(item, batch, markers):
+                        stop = True
+                        break
+            if stop:
+                # Drain whatever was queued before shutdown
+                while True:
+                    try:
+                        self._collect(self._queue.get_nowait(), batch, markers)
+                    except queue.Empty:
+                        break
+            if batch:
+                self._write(batch)
+            set_gauge('history_writer.queue_depth', self._queue.qsize())
+            for marker in markers:
+                marker.done.set()
+            if stop:
+                return
+
+    @staticmethod
+    def _collect(item, batch, markers):
+        """Sort a queue item into rows / flush markers; True means stop"""
+        if item is _STOP:
+            return True
+        if isinstance(item, _FlushMarker):
+            markers.append(item)
+        else:
+            batch.append(item)
+        return False
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        try:
+            save_searches(rows)
+        except Exception as e:
+            incr('history_writer.errors')
+            incr('history_writer.rows_lost', len(rows))
+            print(f'History writer error ({len(rows)} rows lost): {e}')
+            return
+        observe('history_writer.flush_ms', (time.perf_counter() - start) * 1000)
+        observe('history_writer.batch_size', len(rows))
+        incr('history_writer.rows_written', len(rows))
@@ -0,0 +1,134 @@
+"""First-tier spam classifier: hashed word + character n-grams with a linear model"""
+import time
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from sklearn.pipeline import make_pipeline, make_union
+
+TARGET_PRECISION = 0.99  # confident decisions must be at least this precise on validation data
+HASH_FEATURES = 2 ** 20
+
+def build_linear_model():
+    """Hashing vectorizers (stateless, no vocabulary to store) feeding a logistic-loss SGD model"""
+    features = make_union(
+        HashingVectorizer(ngram_range=(1, 2), n_features=HASH_FEATURES, alternate_sign=False),
+        HashingVectorizer(analyzer='char_wb', ngram_range=(3, 5), n_features=HASH_FEATURES, alternate_sign=False)
+    )
+    classifier = SGDClassifier(loss='log_loss', alpha=1e-6, max_iter=30, tol=1e-4,
+                               class_weight='balanced', random_state=42)
+    return make_pipeline(features, classifier)
+
+def pick_thresholds(probs, labels, target=TARGET_PRECISION):
+    """
+    (low, high) such that probs <= low are ham and probs >= high are spam
+    with at least `target` precision on (probs, labels). An unreachable side
+    gets a threshold no probability can pass.
+    """
+    order = np.argsort(-probs)
+    probs, labels = probs[order], np.asarray(labels)[order]
+    counts = np.arange(1, len(probs) + 1)
+
+    high = 1.1
+    spam_precision = np.cumsum(labels) / counts
+    ok = np.flatnonzero(spam_precision >= target)
+    if ok.size:
+        high = float(probs[ok[-1]])
+
+    low = -0.1
+    ham_precision = np.cumsum(1 - labels[::-1]) / counts
+    ok = np.flatnonzero(ham_precision >= target)
+    if ok.size:
+        low = float(probs[::-1][ok[-1]])
+    # Callers label by prob > 0.5, so a confident side never crosses it
+    return min(low, 0.5), max(high, 0.5)
+
+class LinearTier:
+    """
+    Trained first-tier model (any pipeline with predict_proba over raw
+    strings) plus its confidence thresholds. decide() returns the spam
+    probability when it is confident either way, else None (the input
+    should go on to the neural model).
+    """
+    def __init__(self, model, low, high):
+        self.model = model
+        self.low = low
+        self.high = high
+
+    def predict_proba(self, texts):
+        return self.model.predict_proba(list(texts))[:, 1]
+
+    def confident(self, probs):
+        """Boolean mask of the probabilities this tier may decide on its own"""
+        probs = np.asarray(probs)
+        return (probs <= self.low) | (probs >= self.high)
+
+    def decide(self, text):
+        prob = float(self.predict_proba([text])[0])
+        if self.confident(prob):
+            return prob
+        return None
+
+    def save(self, path):
+        joblib.dump({'model': self.model, 'low': self.low, 'high': self.high}, path, compress=3)
+
+    @classmethod
+    def load(cls, path):
+        artifact = joblib.load(path)
+        return cls(artifact['model'], artifact['low'], artifact['high'])
+
+def train_linear_tier(texts, labels, validation_split=0.1, target=TARGET_PRECISION):
+    """
+    Fit on the first part of the (cleaned) training texts and pick the
+    confidence thresholds on the last validation_split. Returns the tier.
+    """
+    split = int(len(texts) * (1 - validation_split))
+    labels = np.asarray(labels)
+    model = build_linear_model()
+    model.fit(list(texts[:split]), labels[:split])
+    tier = LinearTier(model, -0.1, 1.1)
+    tier.low, tier.high = pick_thresholds(tier.predict_proba(texts[split:]), labels[split:], target)
+    return tier
+
+def _per_request_ms(predict, items, limit=200):
+    items = items[:limit]
+    start = time.perf_counter()
+    for item in items:
+        predict(item)
+    return (time.perf_counter() - start) * 1000 / max(1, len(items))
+
+def report_linear_tier(tier, texts_test, y_test, model, X_test, train_seconds):
+    """Print accuracy, coverage and throughput of the linear tier next to the neural model's"""
+    y_test = np.asarray(y_test)
+    start = time.perf_counter()
+    probs = tier.predict_proba(texts_test)
+    linear_batch = time.perf_counter() - start
+    start = time.perf_counter()
+    nn_probs = np.asarray(model.predict(X_test, batch_size=256, verbose=0)).ravel()
+    nn_batch = time.perf_counter() - start
+
+    confident = (probs <= tier.low) | (probs >= tier.high)
+    # Two-tier prediction: the linear model where it is confident, else the neural model
+    tiered = np.where(confident, probs, nn_probs)
+
+    print(f'\n📊 Linear tier (hashed n-grams + SGD), thresholds ham <= {tier.low:.3f}, spam >= {tier.high:.3f}')
+    print(f'{"model":<14} {"accuracy":>9} {"precision":>10} {"recall":>7} {"F1":>7} {"batch/s":>10} {"1 req":>9}')
+    linear_ms = _per_request_ms(lambda text: tier.predict_proba([text]), list(texts_test))
+    nn_ms = _per_request_ms(lambda row: model.predict(row[None, :], verbose=0), np.asarray(X_test))
+    for name, p, seconds, ms in (('linear', probs, linear_batch, linear_ms),
+                                 ('neural', nn_probs, nn_batch, nn_ms),
+                                 ('linear+neural', tiered, None, None)):
+        pred = (p > 0.5).astype(int)
+        rate = f'{len(p) / seconds:>10.0f}' if seconds else f'{"-":>10}'
+        latency = f'{ms:>7.2f}ms' if ms is not None else f'{"-":>9}'
+        print(f'{name:<14} {accuracy_score(y_test, pred):>9.4f} {precision_score(y_test, pred, zero_division=0):>10.4f} '
+              f'{recall_score(y_test, pred, zero_division=0):>7.4f} {f1_score(y_test, pred, zero_division=0):>7.4f} '
+              f'{rate} {latency}')
+    if confident.any():
+        confident_acc = accuracy_score(y_test[confident], (probs[confident] > 0.5).astype(int))
+        print(f'Linear tier decides {confident.mean():.1%} of test inputs alone '
+              f'(accuracy on those {confident_acc:.4f}); trained in {train_seconds:.1f}s')
+    else:
+        print(f'Linear tier is never confident on the test set; trained in {train_seconds:.1f}s')
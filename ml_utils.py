@@ -1,33 +1,117 @@
 """ML utilities for text preprocessing and tokenizer management"""
+import os
 import re
 import pickle
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# (pattern, replacement) passes applied after lowercasing; shared by the
+# per-string and batch cleaners so both give identical output
+TEXT_PASSES = [
+    (re.compile(r'http\S+|www\S+|https\S+'), ' urltoken '),  # Replace URLs
+    (re.compile(r'\S+@\S+'), ' emailtoken '),                  # Replace emails
+    (re.compile(r'[^a-z0-9\s]'), ' '),                          # Remove special characters but keep spaces
+    (re.compile(r'\s+'), ' '),                                  # Remove multiple spaces
+]
+URL_PASSES = [
+    (re.compile(r'https?://'), ''),         # Extract domain and path features
+    (re.compile(r'[^a-z0-9\.\-/]'), ''),    # Keep dots, slashes, hyphens for URL structure
+]
+
+PARALLEL_MIN_ROWS = 100_000  # batches smaller than this are cleaned in-process
+CLEAN_CHUNK_ROWS = 25_000    # rows per worker task
 
 def clean_text(text: str) -> str:
     """Clean and normalize text data"""
     if not isinstance(text, str):
         return ''
     text = text.lower()
-    # Replace URLs
-    text = re.sub(r'http\S+|www\S+|https\S+', ' urltoken ', text)
-    # Replace emails
-    text = re.sub(r'\S+@\S+', ' emailtoken ', text)
-    # Remove special characters but keep spaces
-    text = re.sub(r'[^a-z0-9\s]', ' ', text)
-    # Remove multiple spaces
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    for pattern, replacement in TEXT_PASSES:
+        text = pattern.sub(replacement, text)
+    return text.strip()
 
 def clean_url(url: str) -> str:
     """Clean URL for feature extraction"""
     if not isinstance(url, str):
         return ''
     url = url.lower()
-    # Extract domain and path features
-    url = re.sub(r'https?://', '', url)
-    # Keep dots, slashes, hyphens for URL structure
-    url = re.sub(r'[^a-z0-9\.\-/]', '', url)
+    for pattern, replacement in URL_PASSES:
+        url = pattern.sub(replacement, url)
     return url
 
+# Batch cleaning runs each pass once over a whole column joined with '\n'.
+# None of the passes can match across that separator, so every row comes out
+# exactly as the per-string cleaners would produce it.
+_BATCH_SPACES = re.compile(r' +')
+_BATCH_URL_STRIP = re.compile(r'[^a-z0-9\.\-/\n]')
+
+def _clean_text_chunk(values):
+    # Any whitespace run behaves like one space in every text pass (they only
+    # distinguish whitespace from non-whitespace, and the last pass collapses
+    # runs), so normalising it first frees '\n' to act as the row separator
+    joined = '\n'.join(' '.join(value.lower().split()) if isinstance(value, str) else '' for value in values)
+    for pattern, replacement in TEXT_PASSES[:-1]:
+        joined = pattern.sub(replacement, joined)
+    joined = _BATCH_SPACES.sub(' ', joined)
+    return [row.strip() for row in joined.split('\n')] if values else []
+
+def _clean_url_chunk(values):
+    # A space stands in for embedded newlines: like them it blocks the scheme
+    # match and is then removed by the character filter
+    joined = '\n'.join(value.lower().replace('\n', ' ') if isinstance(value, str) else '' for value in values)
+    joined = URL_PASSES[0][0].sub(URL_PASSES[0][1], joined)
+    joined = _BATCH_URL_STRIP.sub('', joined)
+    return joined.split('\n') if values else []
+
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _run_batch(chunk_fn, values, workers):
+    values = list(values)
+    if workers is None:
+        workers = _available_cpus() if len(values) >= PARALLEL_MIN_ROWS else 1
+    if workers <= 1 or len(values) <= CLEAN_CHUNK_ROWS:
+        return chunk_fn(values)
+    chunks = [values[i:i + CLEAN_CHUNK_ROWS] for i in range(0, len(values), CLEAN_CHUNK_ROWS)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        return [value for chunk in pool.map(chunk_fn, chunks) for value in chunk]
+
+def clean_texts(texts, workers=None):
+    """
+    clean_text for a whole column (list, Series, ...), returned as a list.
+
+    Runs each regex pass once over the whole column; with workers > 1 it is split
+    into chunks cleaned in parallel processes (workers=None does so
+    automatically for batches of PARALLEL_MIN_ROWS or more).
+    """
+    return _run_batch(_clean_text_chunk, texts, workers)
+
+def clean_urls(urls, workers=None):
+    """clean_url for a whole column, returned as a list (see clean_texts)"""
+    return _run_batch(_clean_url_chunk, urls, workers)
+
+# Everything the text / URL cleaning output depends on, for dataset cache keys
+TEXT_CLEANING_CODE = (clean_text, clean_texts, _clean_text_chunk, _run_batch, TEXT_PASSES, _BATCH_SPACES)
+URL_CLEANING_CODE = (clean_url, clean_urls, _clean_url_chunk, _run_batch, URL_PASSES, _BATCH_URL_STRIP)
+
+def check_batch_parity(values, cleaned, clean_fn, sample=1000):
+    """
+    Raise RuntimeError unless `cleaned` (from a batch cleaner) matches
+    clean_fn on up to `sample` evenly spaced values, so training data can
+    never drift from what the per-string cleaner produces at serving time.
+    """
+    values = list(values)
+    if len(values) != len(cleaned):
+        raise RuntimeError(f'Batch cleaning returned {len(cleaned)} values for {len(values)} inputs')
+    step = max(1, len(values) // sample)
+    for i in range(0, len(values), step):
+        if cleaned[i] != clean_fn(values[i]):
+            raise RuntimeError(f'Batch cleaning differs from {clean_fn.__name__} at row {i}: '
+                               f'{cleaned[i]!r} != {clean_fn(values[i])!r}')
+
 def save_tokenizer(tokenizer, path: str):
     """Save tokenizer to disk"""
     with open(path, 'wb') as f:
@@ -44,3 +128,199 @@ def texts_to_sequences(tokenizer, texts, maxlen=200):
     from tensorflow.keras.preprocessing.sequence import pad_sequences
     seq = tokenizer.texts_to_sequences(texts)
     return pad_sequences(seq, maxlen=maxlen, padding='post', truncating='post')
+
+# ========== LENGTH-AWARE SERVING ==========
+
+SEQUENCE_MODES = ('off', 'trim', 'mask', 'auto')
+TRIM_MULTIPLE = 16  # trimmed widths are rounded up to this, bounding the input shapes (and retraces) seen
+
+def trim_padding(seq, min_length=1, multiple=TRIM_MULTIPLE):
+    """Cut a post-padded batch down to its longest sequence (rounded up to `multiple`)"""
+    used = np.flatnonzero(np.asarray(seq).any(axis=0))
+    width = used[-1] + 1 if used.size else 0
+    width = -(-max(width, min_length) // multiple) * multiple
+    return seq[:, :min(width, seq.shape[1])]
+
+def model_input_length(model):
+    """Sequence length a model was built for, or None if it accepts any length"""
+    return model.input_shape[1]
+
+def variable_length_copy(model, mask=False):
+    """
+    Rebuild a Sequential model from its config with a variable-length input,
+    sharing its trained weights. With mask=True the Embedding also gets
+    mask_zero=True, so recurrent layers skip padding steps.
+    """
+    return reshaped_copy(model, [None, None], mask)
+
+def reshaped_copy(model, batch_shape, mask=False):
+    """Rebuild a Sequential model from its config for input batch_shape, sharing its trained weights"""
+    from tensorflow import keras
+    config = model.get_config()
+    for layer in config['layers']:
+        layer_config = layer['config']
+        # tf.keras 2 and Keras 3 name the input shape differently
+        for key in ('batch_input_shape', 'batch_shape'):
+            if layer_config.get(key):
+                layer_config[key] = list(batch_shape)
+        if layer['class_name'] == 'Embedding':
+            layer_config.pop('input_length', None)
+            if mask:
+                layer_config['mask_zero'] = True
+    copy = keras.Sequential.from_config(config)
+    copy.set_weights(model.get_weights())
+    return copy
+
+class LengthAwareModel:
+    """
+    Model wrapper whose predict() splits its input into micro-batches and
+    trims each post-padded micro-batch to its longest sequence. Micro-batches
+    go through predict_on_batch, skipping predict()'s per-call dataset setup.
+    """
+    def __init__(self, model, min_length=1, trim=True):
+        self.model = model
+        self.min_length = min_length
+        self.trim = trim
+
+    def predict(self, seq, batch_size=32, verbose=0):
+        outputs = []
+        for start in range(0, len(seq), batch_size):
+            batch = seq[start:start + batch_size]
+            if self.trim:
+                batch = trim_padding(batch, self.min_length)
+            outputs.append(np.asarray(self.model.predict_on_batch(batch)))
+        return np.concatenate(outputs) if outputs else np.empty((0, 1), dtype='float32')
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+class TFLiteModel:
+    """
+    Keras-style predict() over a TFLite model (see quantization.py). Models
+    are exported with a batch of one, so rows run one at a time, each thread
+    on its own interpreter. Exports of variable-length (bucketed) models get
+    each row trimmed like LengthAwareModel; fixed-length exports get rows
+    post-padded to their length.
+    """
+    def __init__(self, path, num_threads=None, min_length=1):
+        self.num_threads = num_threads
+        self.min_length = min_length
+        with open(path, 'rb') as f:
+            self._content = f.read()
+        # An interpreter's tensors are shared state, so one per thread
+        self._local = threading.local()
+        length = int(self._interpreter().get_input_details()[0]['shape_signature'][1])
+        self.input_length = length if length > 0 else None
+        self.input_shape = (None, self.input_length)
+        self.trim = self.input_length is None
+
+    def _interpreter(self):
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            import tensorflow as tf
+            interpreter = tf.lite.Interpreter(model_content=self._content, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+        return interpreter
+
+    def _fit(self, row):
+        if self.input_length:
+            fitted = np.zeros((1, self.input_length), dtype=row.dtype)
+            fitted[0, :min(len(row), self.input_length)] = row[:self.input_length]
+            return fitted
+        return trim_padding(row[np.newaxis], self.min_length) if self.trim else row[np.newaxis]
+
+    def predict(self, seq, batch_size=None, verbose=0):
+        interpreter = self._interpreter()
+        input_details = interpreter.get_input_details()[0]
+        output = interpreter.get_output_details()[0]['index']
+        seq = np.asarray(seq)
+        outputs = np.empty((len(seq), 1), dtype='float32')
+        for i, row in enumerate(seq):
+            row = self._fit(row).astype(input_details['dtype'])
+            if tuple(input_details['shape']) != row.shape:
+                interpreter.resize_tensor_input(input_details['index'], row.shape)
+                interpreter.allocate_tensors()
+                input_details = interpreter.get_input_details()[0]
+            interpreter.set_tensor(input_details['index'], row)
+            interpreter.invoke()
+            outputs[i] = interpreter.get_tensor(output)[0]
+        return outputs
+
+def length_aware_model(model, mode='auto', min_length=1):
+    """
+    Serving model for a sequence mode:
+      off  - unchanged: every input runs over the full padded length
+      trim - batches are cut to their longest sequence
+      mask - trim, plus masking so shorter sequences in a batch skip their padding
+      auto - trim for models trained without a fixed length (bucketed pipeline), else off
+    TFLite models run one row at a time, so 'mask' serves them as 'trim';
+    fixed-length exports are always served as 'off'.
+    """
+    if isinstance(model, TFLiteModel):
+        model.trim = model.input_length is None and mode != 'off'
+        model.min_length = min_length
+        return model
+    if mode == 'auto':
+        mode = 'trim' if model_input_length(model) is None else 'off'
+    if mode == 'off':
+        return model
+    return LengthAwareModel(variable_length_copy(model, mask=(mode == 'mask')), min_length)
+
+# ========== LONG DOCUMENTS ==========
+
+WINDOW_POOLING = ('max', 'attention')
+
+def window_stride(maxlen):
+    """Default offset between overlapping windows: 2/3 of the window"""
+    return max(1, maxlen * 2 // 3)
+
+def window_token_budget(maxlen, max_windows, stride=None):
+    """Tokens covered by max_windows windows of maxlen tokens, stride apart"""
+    return maxlen + (stride or window_stride(maxlen)) * (max_windows - 1)
+
+def sliding_windows(tokens, window, stride, max_windows):
+    """
+    Start offsets of overlapping windows covering a token list. Beyond
+    max_windows the windows are spread evenly from the first to the last
+    token, so the end of a long document is always scored.
+    """
+    if len(tokens) <= window:
+        return [0]
+    last = len(tokens) - window
+    starts = list(range(0, last, stride)) + [last]
+    if len(starts) > max_windows:
+        starts = sorted({int(round(s)) for s in np.linspace(0, last, max_windows)})
+    return starts
+
+def pool_windows(probs, pooling='max', temperature=1.0):
+    """
+    One document score from its window scores: the max, or attention-style
+    pooling (a softmax over the windows' logits weights their probabilities,
+    so one confident window dominates without ignoring the others).
+    """
+    if pooling == 'max':
+        return float(probs.max())
+    logits = np.log(np.clip(probs, 1e-7, 1 - 1e-7) / np.clip(1 - probs, 1e-7, 1))
+    weights = np.exp((logits - logits.max()) / temperature)
+    return float((weights * probs).sum() / weights.sum())
+
+def score_long_documents(model, tokenizer, texts, maxlen, stride=None, max_windows=8, pooling='max'):
+    """
+    Spam probability of each (already cleaned) text, scoring every token
+    instead of only the first maxlen: each text is cut into overlapping
+    windows of maxlen tokens (stride defaults to 2/3 of maxlen, at most
+    max_windows per text), all windows of all texts are scored in one
+    batched predict and each text's windows are pooled.
+    """
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    stride = stride or window_stride(maxlen)
+    windows, owners = [], []
+    for i, tokens in enumerate(tokenizer.texts_to_sequences(texts)):
+        for start in sliding_windows(tokens, maxlen, stride, max_windows):
+            windows.append(tokens[start:start + maxlen])
+            owners.append(i)
+    seq = pad_sequences(windows, maxlen=maxlen, padding='post', truncating='post')
+    probs = np.asarray(model.predict(seq, batch_size=max(32, len(seq)), verbose=0)).ravel()
+    owners = np.asarray(owners)
+    return [pool_windows(probs[owners == i], pooling) for i in range(len(texts))]
@@ -0,0 +1,101 @@
+"""Post-training dynamic-range quantization of the trained models to TFLite, with an accuracy report"""
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+from ml_utils import TFLiteModel, length_aware_model, model_input_length, reshaped_copy
+
+QUANTIZE_TOLERANCE = 0.005  # largest test accuracy drop (absolute) at which the quantized model is kept
+LATENCY_SAMPLES = 200       # single-row requests timed per model
+
+def quantize_model(model, maxlen):
+    """
+    TFLite flatbuffer of a Keras model with dynamic-range quantization:
+    weights (embedding tables included) stored as int8, activations in float.
+    LSTMs only convert with a static batch size, so the export takes one row
+    at a time; models trained without a fixed length (bucketed pipeline) keep
+    a variable length so serving can trim padding, the rest get maxlen.
+    """
+    length = None if model_input_length(model) is None else maxlen
+    serving = reshaped_copy(model, [1, length])
+    converter = tf.lite.TFLiteConverter.from_keras_model(serving)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    return converter.convert()
+
+def _evaluate(load, X_test, y_test):
+    start = time.perf_counter()
+    model = load()
+    load_seconds = time.perf_counter() - start
+    rows = X_test[:LATENCY_SAMPLES]
+    model.predict(rows[:1], verbose=0)  # warm up
+    latencies = []
+    for i in range(len(rows)):
+        start = time.perf_counter()
+        model.predict(rows[i:i + 1], verbose=0)
+        latencies.append(time.perf_counter() - start)
+    pred = (np.asarray(model.predict(X_test, verbose=0)).ravel() > 0.5).astype(int)
+    return {
+        'accuracy': accuracy_score(y_test, pred),
+        'precision': precision_score(y_test, pred, zero_division=0),
+        'recall': recall_score(y_test, pred, zero_division=0),
+        'f1': f1_score(y_test, pred, zero_division=0),
+        'load_s': load_seconds,
+        'p50_ms': float(np.median(latencies)) * 1000 if latencies else 0.0
+    }
+
+def compare_quantized(model_path, tflite_path, X_test, y_test):
+    """
+    Evaluate the saved float model and its quantized TFLite version as the
+    app serves them (length_aware_model in 'auto' mode) on the test split,
+    and print metrics, file size, load time and median single-request
+    latency. Returns {'float': {...}, 'quantized': {...}}.
+    """
+    X_test, y_test = np.asarray(X_test), np.asarray(y_test)
+    results = {
+        'float': _evaluate(lambda: length_aware_model(load_model(str(model_path))), X_test, y_test),
+        'quantized': _evaluate(lambda: length_aware_model(TFLiteModel(tflite_path)), X_test, y_test)
+    }
+    results['float']['size'] = os.path.getsize(model_path)
+    results['quantized']['size'] = os.path.getsize(tflite_path)
+
+    print('\n📊 Quantization (dynamic range, int8 weights), latency per single request')
+    print(f'{"model":<10} {"accuracy":>9} {"precision":>10} {"recall":>7} {"F1":>7} {"size":>9} {"load":>7} {"p50":>9}')
+    for name, r in results.items():
+        print(f'{name:<10} {r["accuracy"]:>9.4f} {r["precision"]:>10.4f} {r["recall"]:>7.4f} {r["f1"]:>7.4f} '
+              f'{r["size"] / 1024 ** 2:>7.2f}MB {r["load_s"]:>6.2f}s {r["p50_ms"]:>7.2f}ms')
+    return results
+
+def quantize_for_serving(model, model_path, maxlen, X_test, y_test, tolerance=QUANTIZE_TOLERANCE):
+    """
+    Write <model_path>.tflite next to the saved Keras model and keep it only
+    if its test accuracy is within `tolerance` of the float model's and its
+    median single-request latency is no worse (the app serves the .tflite
+    file whenever it exists). Returns the path or None.
+    """
+    tflite_path = Path(model_path).with_suffix('.tflite')
+    try:
+        tflite_path.write_bytes(quantize_model(model, maxlen))
+    except Exception as e:
+        tflite_path.unlink(missing_ok=True)
+        print(f'✗ Quantization failed, serving the float model: {e}')
+        return None
+
+    results = compare_quantized(model_path, tflite_path, X_test, y_test)
+    change = results['quantized']['accuracy'] - results['float']['accuracy']
+    drop = -change
+    if drop > tolerance:
+        tflite_path.unlink()
+        print(f'✗ Quantized model dropped accuracy by {drop:.4f} (tolerance {tolerance}); discarded')
+        return None
+    if results['quantized']['p50_ms'] > results['float']['p50_ms']:
+        tflite_path.unlink()
+        print(f'✗ Quantized model is slower per request ({results["quantized"]["p50_ms"]:.2f}ms vs '
+              f'{results["float"]["p50_ms"]:.2f}ms); discarded')
+        return None
+    print(f'✓ Quantized model saved to: {tflite_path} (accuracy change {change:+.4f}, tolerance {tolerance})')
+    return tflite_path
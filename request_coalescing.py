@@ -0,0 +1,83 @@
+"""Single-flight coalescing of identical in-flight computations"""
+import copy
+import hashlib
+import threading
+
+from runtime_metrics import incr
+
+def normalize_content(content_type, content):
+    """Build a coalescing key from the content type and whitespace-normalized content"""
+    normalized = ' '.join(str(content).split())
+    digest = hashlib.sha256(normalized.encode('utf-8', errors='ignore')).hexdigest()
+    return f'{content_type}:{digest}'
+
+def _waiter_error(error):
+    """
+    A fresh copy of the leader's exception for one waiter, chained to the
+    original. Raising the shared object from several threads would rewrite its
+    __traceback__ under each of them.
+    """
+    try:
+        fresh = copy.copy(error)
+    except Exception:
+        fresh = None
+    if type(fresh) is not type(error):
+        fresh = RuntimeError(f'coalesced call failed: {error!r}')
+    fresh.__traceback__ = None
+    return fresh
+
+class _Call:
+    """One in-flight computation shared by the leader and its waiters"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Run at most one computation per key at a time.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running block until it finishes and receive the
+    same result (or a copy of the same exception, chained to it). Nothing is cached after the leader
+    returns, so later callers trigger a fresh computation.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Run fn() for key, or wait for the identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            incr(f'{self.name}.coalesced_waiters')
+            call.done.wait()
+            if call.error is not None:
+                raise _waiter_error(call.error) from call.error
+            return call.result
+
+        incr(f'{self.name}.leaders')
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        """Number of distinct keys currently being computed"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,40 @@
+"""In-process runtime metrics (counters, gauges and timings) for the web app"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+
+def incr(name, amount=1):
+    """Increment a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def set_gauge(name, value):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[name] = value
+
+def observe(name, value):
+    """Record one observation (e.g. a latency in ms or a batch size)"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+        timing['count'] += 1
+        timing['total'] += value
+        timing['max'] = max(timing['max'], value)
+        timing['last'] = value
+
+def snapshot():
+    """Return a JSON-serialisable copy of all metrics"""
+    with _lock:
+        timings = {}
+        for name, timing in _timings.items():
+            timings[name] = dict(timing, avg=timing['total'] / timing['count'] if timing['count'] else 0.0)
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': timings
+        }
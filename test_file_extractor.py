@@ -0,0 +1,48 @@
+"""Upload type sniffing and OCR preprocessing in file_extractor"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from file_extractor import detect_file_type, estimate_line_height, preprocess_for_ocr
+
+def _bmp():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4)).save(buffer, 'BMP')
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('data, expected', [
+    (_bmp(), 'image'),
+    (b'BMO Alert: verify your account at http://example.tk now', 'txt'),
+    (b'BM' + b'\x00' * 30, None),
+    (b'Hello: world\nDate: today\n\nbody', 'txt'),
+    (b'Name: Bob\nAge: 3\n\nhi', 'txt'),
+    (b'From: a@example.com\nTo: b@example.com\nSubject: hi\n\nbody', 'eml'),
+    (b'From a@example.com Mon Jan  1 00:00:00 2024\nReceived: by x\nFrom: a@example.com\n\nbody', 'eml'),
+    (b'DKIM-Signature: v=1; a=rsa-sha256;\n\tb=abc\nAuthentication-Results: x\n'
+     b'From: a@example.com\nSubject: s\n\nbody', 'eml'),
+    (b'From: me\n\nhello', 'txt'),
+])
+def test_detect_file_type(data, expected):
+    assert detect_file_type(io.BytesIO(data)) == expected
+
+def _text_page(width=1600, height=1200, line_height=23, bar=0):
+    """Grayscale page of dark 'text' lines, optionally with a black bar down the left edge"""
+    pixels = np.full((height, width), 255, dtype=np.uint8)
+    for top in range(60, height - 60, line_height * 2):
+        for left in range(120, width - 120, 40):
+            pixels[top:top + line_height, left:left + 28] = 0
+    pixels[:, :bar] = 0
+    return pixels
+
+def test_line_height_of_text():
+    assert estimate_line_height(_text_page() < 128) == pytest.approx(23, abs=1)
+
+def test_line_height_ignores_full_height_bar():
+    # Ink in every row is one run as tall as the image: not a text line
+    assert estimate_line_height(_text_page(bar=80) < 128) is None
+
+def test_preprocess_keeps_size_without_line_estimate():
+    image = Image.fromarray(_text_page(bar=80))
+    assert preprocess_for_ocr(image).height >= image.height - 20
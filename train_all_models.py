@@ -1,29 +1,178 @@
 """
 Train All Models - Email, SMS, and URL Detection
-This script trains all three models sequentially with optimized settings for speed.
+This script trains all three models in parallel, each on its own share of the CPUs.
+
+    python train_all_models.py [--sequential] [--models email sms url]
+
+In parallel mode every trainer gets a disjoint set of cores (CPU affinity)
+and a matching TensorFlow intra-op / inter-op and OpenMP thread budget, so
+the three runs don't oversubscribe the machine. Output of each trainer is
+written to logs/<script>.log. --sequential runs them one after another on
+all cores, echoing output to the console as well as the log.
 """
+import argparse
+import os
 import subprocess
 import sys
+import time
 from pathlib import Path
 
 BASE = Path(__file__).resolve().parent
+LOGS_DIR = BASE / 'logs'
 
-def run_training(script_name):
-    """Run a training script and display results"""
-    print('\n' + '='*70)
-    print(f'STARTING: {script_name}')
-    print('='*70 + '\n')
-    
-    result = subprocess.run([sys.executable, script_name], cwd=BASE)
-    
-    if result.returncode != 0:
-        print(f'\n❌ ERROR: {script_name} failed with exit code {result.returncode}')
-        return False
-    
-    print(f'\n✅ SUCCESS: {script_name} completed')
-    return True
+SCRIPTS = {
+    'email': ('train_email.py', 'Email Spam Model'),
+    'sms': ('train_sms.py', 'SMS Spam Model'),
+    'url': ('train_url.py', 'URL Phishing Model')
+}
+
+def available_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def partition_cpus(cpus, parts):
+    """Split cpus into `parts` contiguous groups of near-equal size (groups share CPUs if there are too few)"""
+    if len(cpus) < parts:
+        return [[cpus[i % len(cpus)]] for i in range(parts)]
+    size, extra = divmod(len(cpus), parts)
+    groups, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cpus[start:end])
+        start = end
+    return groups
+
+def thread_env(cpus):
+    """Environment giving a trainer a thread budget matching its CPU share"""
+    env = dict(os.environ)
+    env.update({
+        'TF_NUM_INTRAOP_THREADS': str(len(cpus)),
+        'TF_NUM_INTEROP_THREADS': str(min(2, len(cpus))),
+        'OMP_NUM_THREADS': str(len(cpus)),
+        'PYTHONUNBUFFERED': '1'
+    })
+    return env
+
+def start_training(script_name, cpus, log_file, echo=False):
+    """Start a trainer pinned to cpus, with its output going to log_file (piped when echoing)"""
+    def pin():
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+
+    return subprocess.Popen(
+        [sys.executable, script_name], cwd=BASE, env=thread_env(cpus),
+        stdout=subprocess.PIPE if echo else log_file, stderr=subprocess.STDOUT,
+        preexec_fn=pin if os.name == 'posix' else None
+    )
+
+def wait_any(running):
+    """Reap the next trainer to exit; returns (process, exit code, CPU seconds)"""
+    if hasattr(os, 'wait4'):
+        pid, status, usage = os.wait4(-1, 0)
+        proc = running[pid]
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return proc, proc.returncode, usage.ru_utime + usage.ru_stime
+    # No wait4 (Windows): poll, without CPU accounting
+    while True:
+        for proc in running.values():
+            if proc.poll() is not None:
+                return proc, proc.returncode, None
+        time.sleep(0.5)
+
+def print_log_tail(log_path, lines=20):
+    tail = log_path.read_text(encoding='utf-8', errors='replace').splitlines()[-lines:]
+    for line in tail:
+        print(f'    | {line}')
+
+def run_parallel(keys, max_jobs):
+    """Run trainers concurrently, each pinned to its own CPU group"""
+    groups = partition_cpus(available_cpus(), min(max_jobs, len(keys)))
+    free_groups = list(groups)
+    pending = list(keys)
+    running = {}   # pid -> Popen
+    launched = {}  # pid -> (model key, cpus, log file, log path, start time)
+    results = {}
+
+    while pending or running:
+        while pending and free_groups:
+            key = pending.pop(0)
+            script, name = SCRIPTS[key]
+            cpus = free_groups.pop(0)
+            log_path = LOGS_DIR / f'{Path(script).stem}.log'
+            log_file = open(log_path, 'w', encoding='utf-8')
+            proc = start_training(script, cpus, log_file)
+            print(f'▶ STARTED: {script} on CPUs {format_cpus(cpus)} (log: {log_path.relative_to(BASE)})')
+            running[proc.pid] = proc
+            launched[proc.pid] = (key, cpus, log_file, log_path, time.perf_counter())
+
+        proc, code, cpu_time = wait_any(running)
+        del running[proc.pid]
+        key, cpus, log_file, log_path, started = launched.pop(proc.pid)
+        log_file.close()
+        free_groups.append(cpus)
+        wall = time.perf_counter() - started
+        results[key] = (code == 0, wall, cpu_time, cpus, log_path)
+
+        script = SCRIPTS[key][0]
+        if code == 0:
+            print(f'✅ SUCCESS: {script} completed in {wall:.1f}s')
+        else:
+            print(f'❌ ERROR: {script} failed with exit code {code} after {wall:.1f}s. Last lines of its log:')
+            print_log_tail(log_path)
+    return results
+
+def run_sequential(keys):
+    """Run trainers one after another on all CPUs, echoing output and writing per-model logs"""
+    cpus = available_cpus()
+    results = {}
+    for key in keys:
+        script, name = SCRIPTS[key]
+        print('\n' + '='*70)
+        print(f'STARTING: {script}')
+        print('='*70 + '\n')
+
+        log_path = LOGS_DIR / f'{Path(script).stem}.log'
+        started = time.perf_counter()
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            proc = start_training(script, cpus, log_file, echo=True)
+            for line in iter(proc.stdout.readline, b''):
+                text = line.decode('utf-8', errors='replace')
+                sys.stdout.write(text)
+                log_file.write(text)
+            proc.stdout.close()
+            _, code, cpu_time = wait_any({proc.pid: proc})
+        wall = time.perf_counter() - started
+        results[key] = (code == 0, wall, cpu_time, cpus, log_path)
+
+        if code != 0:
+            print(f'\n❌ ERROR: {script} failed with exit code {code}')
+            print(f'\n⚠️  Warning: {name} training failed. Continuing with next model...')
+        else:
+            print(f'\n✅ SUCCESS: {script} completed')
+    return results
+
+def format_cpus(cpus):
+    """Compact CPU list, e.g. 0-9,12"""
+    ranges, start = [], None
+    for i, cpu in enumerate(cpus):
+        if start is None:
+            start = cpu
+        if i + 1 == len(cpus) or cpus[i + 1] != cpu + 1:
+            ranges.append(f'{start}-{cpu}' if cpu != start else f'{cpu}')
+            start = None
+    return ','.join(ranges)
 
 def main():
+    parser = argparse.ArgumentParser(description='Train the email, SMS and URL models')
+    parser.add_argument('--sequential', action='store_true', help='train one model at a time on all CPUs')
+    parser.add_argument('--models', nargs='+', choices=list(SCRIPTS), default=list(SCRIPTS),
+                        help='models to train (default: all)')
+    parser.add_argument('--jobs', type=int, default=len(SCRIPTS), help='trainers running at once in parallel mode')
+    args = parser.parse_args()
+    LOGS_DIR.mkdir(exist_ok=True)
+
     print('='*70)
     print('SPAM DETECTION SYSTEM - TRAINING ALL MODELS')
     print('='*70)
@@ -36,37 +185,43 @@ def main():
     print('  - Smaller batch sizes and fewer epochs')
     print('  - Dataset sampling for large files')
     print('  - Early stopping to prevent overtraining')
+    if args.sequential:
+        print('  - Sequential mode: one model at a time on all CPUs')
+    else:
+        print(f'  - Parallel mode: up to {args.jobs} models at once on disjoint CPU sets '
+              f'({len(available_cpus())} CPUs available)')
     print('='*70)
-    
-    scripts = [
-        ('train_email.py', 'Email Spam Model'),
-        ('train_sms.py', 'SMS Spam Model'),
-        ('train_url.py', 'URL Phishing Model')
-    ]
-    
-    results = {}
-    
-    for script, name in scripts:
-        success = run_training(script)
-        results[name] = success
-        
-        if not success:
-            print(f'\n⚠️  Warning: {name} training failed. Continuing with next model...')
-    
+
+    start = time.perf_counter()
+    if args.sequential:
+        results = run_sequential(args.models)
+    else:
+        results = run_parallel(args.models, max(1, args.jobs))
+    total_wall = time.perf_counter() - start
+
     # Summary
     print('\n' + '='*70)
     print('TRAINING SUMMARY')
     print('='*70)
-    
-    for name, success in results.items():
+
+    print(f'{"Model":<22} {"Status":<11} {"Wall":>9} {"CPU":>9} {"CPUs":>8}  Log')
+    for key in args.models:
+        success, wall, cpu_time, cpus, log_path = results[key]
         status = '✅ SUCCESS' if success else '❌ FAILED'
-        print(f'{name:.<50} {status}')
-    
-    successful = sum(results.values())
+        cpu = f'{cpu_time:.1f}s' if cpu_time is not None else '-'
+        print(f'{SCRIPTS[key][1]:<22} {status:<11} {wall:8.1f}s {cpu:>9} {len(cpus):>8}  {log_path.relative_to(BASE)}')
+
+    serial_wall = sum(result[1] for result in results.values())
+    cpu_times = [result[2] for result in results.values() if result[2] is not None]
+    print(f'\nTotal wall time: {total_wall:.1f}s (sum of per-model wall times: {serial_wall:.1f}s)')
+    if cpu_times:
+        print(f'Total CPU time: {sum(cpu_times):.1f}s')
+
+    successful = sum(result[0] for result in results.values())
     total = len(results)
-    
+
     print(f'\nCompleted: {successful}/{total} models trained successfully')
-    
+
     if successful == total:
         print('\n🎉 All models trained successfully!')
         print('\nNext steps:')
@@ -75,8 +230,9 @@ def main():
         print('  3. Test the spam detection system!')
     else:
         print('\n⚠️  Some models failed. Check the error messages above.')
-    
+
     print('='*70)
+    return 0 if successful == total else 1
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
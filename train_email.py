@@ -1,9 +1,10 @@
 """Train Email Spam Detection Model using LSTM"""
+import argparse
 import os
+import time
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Embedding, LSTM, Dense, Dropout, SpatialDropout1D
@@ -12,7 +13,14 @@ from tensorflow.keras.callbacks import EarlyStopping
 import warnings
 warnings.filterwarnings('ignore')
 
-from ml_utils import clean_text, save_tokenizer, texts_to_sequences
+import csv_loader
+from csv_loader import read_sample
+from dataset_cache import cached_dataset
+from linear_tier import report_linear_tier, train_linear_tier
+from ml_utils import (TEXT_CLEANING_CODE, check_batch_parity, clean_text, clean_texts,
+                      length_aware_model, save_tokenizer, texts_to_sequences)
+from quantization import QUANTIZE_TOLERANCE, quantize_for_serving
+from train_utils import PIPELINES, compare_pipelines, fit_model, split_dataset
 
 BASE = Path(__file__).resolve().parent
 DATA_DIR = BASE / 'datasets' / 'unzipped'
@@ -34,16 +42,8 @@ def load_email_data():
         for file in folder_path.glob('**/*.csv'):
             print(f'  Reading {file.name}...')
             try:
-                # Try different encodings - sample only 50% of large files for speed
-                for encoding in ['utf-8', 'latin1', 'iso-8859-1']:
-                    try:
-                        df = pd.read_csv(file, encoding=encoding, on_bad_lines='skip')
-                        # Sample large datasets for faster training
-                        if len(df) > 20000:
-                            df = df.sample(n=20000, random_state=42)
-                        break
-                    except:
-                        continue
+                # Stream the file, keeping a seeded sample of 20000 rows for faster training
+                df = read_sample(file, n=20000, seed=42)
                 
                 # Common column name patterns for email spam datasets
                 # Try to identify text and label columns
@@ -82,7 +82,10 @@ def load_email_data():
     print(f'\nTotal emails loaded: {len(df)}')
     
     # Clean and encode labels
-    df['text'] = df['text'].astype(str).apply(clean_text)
+    raw = df['text'].astype(str).tolist()
+    df['text'] = clean_texts(raw)
+    # Training must see exactly what clean_text produces at serving time
+    check_batch_parity(raw, df['text'].tolist(), clean_text)
     df['label'] = df['label'].astype(str).str.lower()
     df['label'] = df['label'].map(lambda x: 1 if any(s in str(x) for s in ['spam', '1', 'true']) else 0)
     
@@ -111,12 +114,12 @@ def build_email_model(vocab_size=15000, embed_dim=64, input_len=150):
     )
     return model
 
-def main():
-    print('='*60)
-    print('EMAIL SPAM DETECTION - MODEL TRAINING')
-    print('='*60)
-    
-    # Load data
+def dataset_files():
+    """CSV files load_email_data reads"""
+    return [file for folder in ['email-1', 'email-2'] for file in (DATA_DIR / folder).glob('**/*.csv')]
+
+def prepare_data():
+    """Load, clean and tokenize the dataset; returns ({'X': sequences, 'y': labels, 'texts': cleaned texts}, tokenizer)"""
     df = load_email_data()
     X = df['text'].tolist()
     y = df['label'].values
@@ -124,7 +127,7 @@ def main():
     # Sample dataset for faster training (use 30% of data)
     if len(X) > 30000:
         print(f'\nSampling dataset for faster training (using 30000 samples)...')
-        indices = np.random.choice(len(X), 30000, replace=False)
+        indices = np.random.default_rng(42).choice(len(X), 30000, replace=False)
         X = [X[i] for i in indices]
         y = y[indices]
     
@@ -135,37 +138,77 @@ def main():
     X_seq = texts_to_sequences(tokenizer, X, maxlen=150)
     
     print(f'Vocabulary size: {min(15000, len(tokenizer.word_index))}')
+    # Cleaned texts too, for the linear tier
+    return {'X': X_seq, 'y': y, 'texts': np.array(X, dtype=object)}, tokenizer
+
+def dataset_arrays(refresh=False):
+    """Preprocessed ({'X', 'y', 'texts'} arrays, tokenizer), from the dataset cache when possible"""
+    return cached_dataset(
+        'email', dataset_files(), {'num_words': 15000, 'maxlen': 150, 'max_samples': 30000},
+        build=prepare_data, code=[load_email_data, csv_loader, *TEXT_CLEANING_CODE],
+        refresh=refresh
+    )
+
+def load_dataset(refresh=False):
+    """Preprocessed (sequences, labels, tokenizer), from the dataset cache when possible"""
+    arrays, tokenizer = dataset_arrays(refresh)
+    return arrays['X'], arrays['y'], tokenizer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--refresh-cache', action='store_true', help='rebuild the preprocessed dataset cache')
+    parser.add_argument('--pipeline', choices=PIPELINES, default='fixed',
+                        help='fixed: pad every example to the full length; bucketed: tf.data length buckets')
+    parser.add_argument('--compare-pipelines', action='store_true',
+                        help='first train once with each pipeline and report epoch time and accuracy')
+    parser.add_argument('--quantize-tolerance', type=float, default=QUANTIZE_TOLERANCE,
+                        help='largest test accuracy drop at which the int8 TFLite model is kept for serving')
+    args = parser.parse_args()
+    
+    print('='*60)
+    print('EMAIL SPAM DETECTION - MODEL TRAINING')
+    print('='*60)
+    
+    # Load data (cleaned + tokenized arrays are reused while the CSVs and code are unchanged)
+    arrays, tokenizer = dataset_arrays(refresh=args.refresh_cache)
+    X_seq, y, texts = arrays['X'], arrays['y'], arrays['texts']
     
     # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_seq, y, test_size=0.2, random_state=42, stratify=y
-    )
+    X_train, X_test, y_train, y_test = split_dataset(X_seq, y)
     
     print(f'\nTrain samples: {len(X_train)}, Test samples: {len(X_test)}')
     
+    # Optional side-by-side run of both input pipelines
+    if args.compare_pipelines:
+        compare_pipelines(lambda input_len: build_email_model(vocab_size=15000, input_len=input_len),
+                          X_train, y_train, X_test, y_test, batch_size=128, epochs=5, maxlen=150)
+    
     # Build and train model
     print('\nBuilding model...')
-    model = build_email_model(vocab_size=15000, input_len=150)
+    # Bucketed batches vary in length, so the model takes any sequence length
+    model = build_email_model(vocab_size=15000, input_len=150 if args.pipeline == 'fixed' else None)
     model.summary()
     
-    print('\nTraining model (optimized for speed)...')
+    print(f'\nTraining model (optimized for speed, {args.pipeline} pipeline)...')
     es = EarlyStopping(monitor='val_loss', patience=2, restore_best_weights=True, verbose=1)
     
-    history = model.fit(
-        X_train, y_train,
-        validation_split=0.1,
+    history, epoch_times = fit_model(
+        model, X_train, y_train,
+        pipeline=args.pipeline,
         epochs=5,
         batch_size=128,
-        callbacks=[es],
-        verbose=1
+        callbacks=[es]
     )
+    print(f'Epoch times: {", ".join(f"{t:.1f}s" for t in epoch_times)}')
     
     # Evaluate
     print('\n' + '='*60)
     print('EVALUATION RESULTS')
     print('='*60)
     
-    y_pred_prob = model.predict(X_test, verbose=0)
+    # As the app serves it: bucketed models get trimmed batches, like in training
+    serving_model = length_aware_model(model)
+    y_pred_prob = serving_model.predict(X_test, verbose=0)
     y_pred = (y_pred_prob > 0.5).astype(int).flatten()
     
     acc = accuracy_score(y_test, y_pred)
@@ -181,6 +224,13 @@ def main():
     
     print('\n' + classification_report(y_test, y_pred, target_names=['Ham', 'Spam']))
     
+    # Linear first tier on the same split, compared with (and in front of) the LSTM
+    print('\nTraining linear tier...')
+    texts_train, texts_test = split_dataset(texts, y)[:2]
+    start = time.perf_counter()
+    linear = train_linear_tier(texts_train, y_train)
+    report_linear_tier(linear, texts_test, y_test, serving_model, X_test, time.perf_counter() - start)
+    
     # Save model and tokenizer
     model_path = MODELS_DIR / 'email_model.h5'
     tokenizer_path = MODELS_DIR / 'tokenizer_email.pkl'
@@ -190,6 +240,13 @@ def main():
     
     print(f'\n✓ Model saved to: {model_path}')
     print(f'✓ Tokenizer saved to: {tokenizer_path}')
+    
+    linear_path = MODELS_DIR / 'email_linear.joblib'
+    linear.save(str(linear_path))
+    print(f'✓ Linear tier saved to: {linear_path}')
+    
+    # Dynamic-range quantized copy for serving, kept only within the accuracy tolerance
+    quantize_for_serving(model, model_path, 150, X_test, y_test, args.quantize_tolerance)
     print('\n' + '='*60)
 
 if __name__ == '__main__':
@@ -1,9 +1,10 @@
 """Train SMS Spam Detection Model using LSTM"""
+import argparse
 import os
+import time
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Embedding, LSTM, Dense, Dropout, SpatialDropout1D, Bidirectional
@@ -12,7 +13,14 @@ from tensorflow.keras.callbacks import EarlyStopping
 import warnings
 warnings.filterwarnings('ignore')
 
-from ml_utils import clean_text, save_tokenizer, texts_to_sequences
+import csv_loader
+from csv_loader import read_sample
+from dataset_cache import cached_dataset
+from linear_tier import report_linear_tier, train_linear_tier
+from ml_utils import (TEXT_CLEANING_CODE, check_batch_parity, clean_text, clean_texts,
+                      length_aware_model, save_tokenizer, texts_to_sequences)
+from quantization import QUANTIZE_TOLERANCE, quantize_for_serving
+from train_utils import PIPELINES, compare_pipelines, fit_model, split_dataset
 
 BASE = Path(__file__).resolve().parent
 DATA_DIR = BASE / 'datasets' / 'unzipped'
@@ -34,22 +42,14 @@ def load_sms_data():
         if file.suffix.lower() in ['.csv', '.tsv', '.txt']:
             print(f'  Reading {file.name}...')
             try:
-                # Try different delimiters and encodings
-                for sep in ['\t', ',', '|']:
-                    for encoding in ['utf-8', 'latin1', 'iso-8859-1']:
-                        try:
-                            df = pd.read_csv(file, sep=sep, encoding=encoding, on_bad_lines='skip', header=None)
-                            if len(df.columns) >= 2 and len(df) > 10:
-                                # Assume first column is label, second is text
-                                temp_df = df.iloc[:, [0, 1]].copy()
-                                temp_df.columns = ['label', 'text']
-                                all_data.append(temp_df)
-                                print(f'    ✓ Loaded {len(temp_df)} messages')
-                                break
-                        except:
-                            continue
-                    if all_data and len(all_data[-1]) > 10:
-                        break
+                # Delimiter and encoding are sniffed from the start of the file
+                df = read_sample(file, header=None, delimiters='\t,|')
+                if len(df.columns) >= 2 and len(df) > 10:
+                    # Assume first column is label, second is text
+                    temp_df = df.iloc[:, [0, 1]].copy()
+                    temp_df.columns = ['label', 'text']
+                    all_data.append(temp_df)
+                    print(f'    ✓ Loaded {len(temp_df)} messages')
             except Exception as e:
                 print(f'    ✗ Error: {e}')
     
@@ -60,7 +60,10 @@ def load_sms_data():
     print(f'\nTotal SMS messages: {len(df)}')
     
     # Clean data
-    df['text'] = df['text'].astype(str).apply(clean_text)
+    raw = df['text'].astype(str).tolist()
+    df['text'] = clean_texts(raw)
+    # Training must see exactly what clean_text produces at serving time
+    check_batch_parity(raw, df['text'].tolist(), clean_text)
     df['label'] = df['label'].astype(str).str.lower()
     df['label'] = df['label'].map(lambda x: 1 if any(s in str(x) for s in ['spam', '1', 'true']) else 0)
     
@@ -88,12 +91,12 @@ def build_sms_model(vocab_size=8000, embed_dim=64, input_len=100):
     )
     return model
 
-def main():
-    print('='*60)
-    print('SMS SPAM DETECTION - MODEL TRAINING')
-    print('='*60)
-    
-    # Load data
+def dataset_files():
+    """CSV/TSV/TXT files load_sms_data reads"""
+    return [file for file in (DATA_DIR / 'sms').glob('**/*') if file.suffix.lower() in ['.csv', '.tsv', '.txt']]
+
+def prepare_data():
+    """Load, clean and tokenize the dataset; returns ({'X': sequences, 'y': labels, 'texts': cleaned texts}, tokenizer)"""
     df = load_sms_data()
     X = df['text'].tolist()
     y = df['label'].values
@@ -105,37 +108,77 @@ def main():
     X_seq = texts_to_sequences(tokenizer, X, maxlen=100)
     
     print(f'Vocabulary size: {min(8000, len(tokenizer.word_index))}')
+    # Cleaned texts too, for the linear tier
+    return {'X': X_seq, 'y': y, 'texts': np.array(X, dtype=object)}, tokenizer
+
+def dataset_arrays(refresh=False):
+    """Preprocessed ({'X', 'y', 'texts'} arrays, tokenizer), from the dataset cache when possible"""
+    return cached_dataset(
+        'sms', dataset_files(), {'num_words': 8000, 'maxlen': 100},
+        build=prepare_data, code=[load_sms_data, csv_loader, *TEXT_CLEANING_CODE],
+        refresh=refresh
+    )
+
+def load_dataset(refresh=False):
+    """Preprocessed (sequences, labels, tokenizer), from the dataset cache when possible"""
+    arrays, tokenizer = dataset_arrays(refresh)
+    return arrays['X'], arrays['y'], tokenizer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--refresh-cache', action='store_true', help='rebuild the preprocessed dataset cache')
+    parser.add_argument('--pipeline', choices=PIPELINES, default='fixed',
+                        help='fixed: pad every example to the full length; bucketed: tf.data length buckets')
+    parser.add_argument('--compare-pipelines', action='store_true',
+                        help='first train once with each pipeline and report epoch time and accuracy')
+    parser.add_argument('--quantize-tolerance', type=float, default=QUANTIZE_TOLERANCE,
+                        help='largest test accuracy drop at which the int8 TFLite model is kept for serving')
+    args = parser.parse_args()
+    
+    print('='*60)
+    print('SMS SPAM DETECTION - MODEL TRAINING')
+    print('='*60)
+    
+    # Load data (cleaned + tokenized arrays are reused while the CSVs and code are unchanged)
+    arrays, tokenizer = dataset_arrays(refresh=args.refresh_cache)
+    X_seq, y, texts = arrays['X'], arrays['y'], arrays['texts']
     
     # Split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_seq, y, test_size=0.2, random_state=42, stratify=y
-    )
+    X_train, X_test, y_train, y_test = split_dataset(X_seq, y)
     
     print(f'\nTrain samples: {len(X_train)}, Test samples: {len(X_test)}')
     
+    # Optional side-by-side run of both input pipelines
+    if args.compare_pipelines:
+        compare_pipelines(lambda input_len: build_sms_model(vocab_size=8000, input_len=input_len),
+                          X_train, y_train, X_test, y_test, batch_size=128, epochs=5, maxlen=100)
+    
     # Build model
     print('\nBuilding model...')
-    model = build_sms_model(vocab_size=8000, input_len=100)
+    # Bucketed batches vary in length, so the model takes any sequence length
+    model = build_sms_model(vocab_size=8000, input_len=100 if args.pipeline == 'fixed' else None)
     model.summary()
     
-    print('\nTraining model (optimized for speed)...')
+    print(f'\nTraining model (optimized for speed, {args.pipeline} pipeline)...')
     es = EarlyStopping(monitor='val_loss', patience=2, restore_best_weights=True, verbose=1)
     
-    history = model.fit(
-        X_train, y_train,
-        validation_split=0.1,
+    history, epoch_times = fit_model(
+        model, X_train, y_train,
+        pipeline=args.pipeline,
         epochs=5,
         batch_size=128,
-        callbacks=[es],
-        verbose=1
+        callbacks=[es]
     )
+    print(f'Epoch times: {", ".join(f"{t:.1f}s" for t in epoch_times)}')
     
     # Evaluate
     print('\n' + '='*60)
     print('EVALUATION RESULTS')
     print('='*60)
     
-    y_pred_prob = model.predict(X_test, verbose=0)
+    # As the app serves it: bucketed models get trimmed batches, like in training
+    serving_model = length_aware_model(model)
+    y_pred_prob = serving_model.predict(X_test, verbose=0)
     y_pred = (y_pred_prob > 0.5).astype(int).flatten()
     
     acc = accuracy_score(y_test, y_pred)
@@ -151,6 +194,13 @@ def main():
     
     print('\n' + classification_report(y_test, y_pred, target_names=['Ham', 'Spam']))
     
+    # Linear first tier on the same split, compared with (and in front of) the LSTM
+    print('\nTraining linear tier...')
+    texts_train, texts_test = split_dataset(texts, y)[:2]
+    start = time.perf_counter()
+    linear = train_linear_tier(texts_train, y_train)
+    report_linear_tier(linear, texts_test, y_test, serving_model, X_test, time.perf_counter() - start)
+    
     # Save
     model_path = MODELS_DIR / 'sms_model.h5'
     tokenizer_path = MODELS_DIR / 'tokenizer_sms.pkl'
@@ -160,6 +210,13 @@ def main():
     
     print(f'\n✓ Model saved to: {model_path}')
     print(f'✓ Tokenizer saved to: {tokenizer_path}')
+    
+    linear_path = MODELS_DIR / 'sms_linear.joblib'
+    linear.save(str(linear_path))
+    print(f'✓ Linear tier saved to: {linear_path}')
+    
+    # Dynamic-range quantized copy for serving, kept only within the accuracy tolerance
+    quantize_for_serving(model, model_path, 100, X_test, y_test, args.quantize_tolerance)
     print('\n' + '='*60)
 
 if __name__ == '__main__':
@@ -1,9 +1,10 @@
 """Train URL Phishing Detection Model using CNN"""
+import argparse
 import os
+import time
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Embedding, Conv1D, GlobalMaxPooling1D, Dense, Dropout
@@ -12,7 +13,14 @@ from tensorflow.keras.callbacks import EarlyStopping
 import warnings
 warnings.filterwarnings('ignore')
 
-from ml_utils import clean_url, save_tokenizer, texts_to_sequences
+import csv_loader
+from csv_loader import read_sample
+from dataset_cache import cached_dataset
+from ml_utils import (URL_CLEANING_CODE, check_batch_parity, clean_url, clean_urls,
+                      length_aware_model, save_tokenizer, texts_to_sequences)
+from quantization import QUANTIZE_TOLERANCE, quantize_for_serving
+from train_utils import PIPELINES, compare_pipelines, fit_model, split_dataset
+from url_features import report_url_features, train_url_feature_tier
 
 BASE = Path(__file__).resolve().parent
 DATA_DIR = BASE / 'datasets' / 'unzipped'
@@ -33,15 +41,8 @@ def load_url_data():
         for file in folder_path.glob('**/*.csv'):
             print(f'  Reading {file.name}...')
             try:
-                for encoding in ['utf-8', 'latin1', 'iso-8859-1']:
-                    try:
-                        df = pd.read_csv(file, encoding=encoding, on_bad_lines='skip')
-                        # Sample large datasets for speed
-                        if len(df) > 30000:
-                            df = df.sample(n=30000, random_state=42)
-                        break
-                    except:
-                        continue
+                # Stream the file, keeping a seeded sample of 30000 rows for speed
+                df = read_sample(file, n=30000, seed=42)
                 
                 # Find URL and label columns
                 url_col = None
@@ -77,7 +78,11 @@ def load_url_data():
     print(f'\nTotal URLs loaded: {len(df)}')
     
     # Clean
-    df['url'] = df['url'].astype(str).apply(clean_url)
+    raw = df['url'].astype(str).tolist()
+    df['raw_url'] = raw  # the lexical feature model needs scheme, '@', '?' etc.
+    df['url'] = clean_urls(raw)
+    # Training must see exactly what clean_url produces at serving time
+    check_batch_parity(raw, df['url'].tolist(), clean_url)
     df['label'] = df['label'].astype(str).str.lower()
     
     # Encode label: CORRECT MAPPING
@@ -115,12 +120,12 @@ def build_url_model(vocab_size=5000, embed_dim=32, input_len=80):
     )
     return model
 
-def main():
-    print('='*60)
-    print('URL PHISHING DETECTION - MODEL TRAINING')
-    print('='*60)
-    
-    # Load data
+def dataset_files():
+    """CSV files load_url_data reads"""
+    return [file for folder in ['url-1', 'url-2'] for file in (DATA_DIR / folder).glob('**/*.csv')]
+
+def prepare_data():
+    """Load, clean and tokenize the dataset; returns ({'X': sequences, 'y': labels, 'urls': raw URLs}, tokenizer)"""
     df = load_url_data()
     X = df['url'].tolist()
     y = df['label'].values
@@ -132,37 +137,76 @@ def main():
     X_seq = texts_to_sequences(tokenizer, X, maxlen=80)
     
     print(f'Character vocabulary size: {min(5000, len(tokenizer.word_index))}')
+    return {'X': X_seq, 'y': y, 'urls': df['raw_url'].to_numpy(dtype=object)}, tokenizer
+
+def dataset_arrays(refresh=False):
+    """Preprocessed ({'X', 'y', 'urls'} arrays, tokenizer), from the dataset cache when possible"""
+    return cached_dataset(
+        'url', dataset_files(), {'num_words': 5000, 'maxlen': 80, 'char_level': True},
+        build=prepare_data, code=[load_url_data, csv_loader, *URL_CLEANING_CODE],
+        refresh=refresh
+    )
+
+def load_dataset(refresh=False):
+    """Preprocessed (sequences, labels, tokenizer), from the dataset cache when possible"""
+    arrays, tokenizer = dataset_arrays(refresh)
+    return arrays['X'], arrays['y'], tokenizer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--refresh-cache', action='store_true', help='rebuild the preprocessed dataset cache')
+    parser.add_argument('--pipeline', choices=PIPELINES, default='fixed',
+                        help='fixed: pad every example to the full length; bucketed: tf.data length buckets')
+    parser.add_argument('--compare-pipelines', action='store_true',
+                        help='first train once with each pipeline and report epoch time and accuracy')
+    parser.add_argument('--quantize-tolerance', type=float, default=QUANTIZE_TOLERANCE,
+                        help='largest test accuracy drop at which the int8 TFLite model is kept for serving')
+    args = parser.parse_args()
+    
+    print('='*60)
+    print('URL PHISHING DETECTION - MODEL TRAINING')
+    print('='*60)
+    
+    # Load data (cleaned + tokenized arrays are reused while the CSVs and code are unchanged)
+    arrays, tokenizer = dataset_arrays(refresh=args.refresh_cache)
+    X_seq, y, urls = arrays['X'], arrays['y'], arrays['urls']
     
     # Split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_seq, y, test_size=0.2, random_state=42, stratify=y
-    )
+    X_train, X_test, y_train, y_test = split_dataset(X_seq, y)
     
     print(f'\nTrain samples: {len(X_train)}, Test samples: {len(X_test)}')
     
+    # Optional side-by-side run of both input pipelines
+    if args.compare_pipelines:
+        compare_pipelines(lambda input_len: build_url_model(vocab_size=5000, input_len=input_len),
+                          X_train, y_train, X_test, y_test, batch_size=256, epochs=5, maxlen=80, min_length=3)
+    
     # Build model
     print('\nBuilding model...')
-    model = build_url_model(vocab_size=5000, input_len=80)
+    # Bucketed batches vary in length, so the model takes any sequence length
+    model = build_url_model(vocab_size=5000, input_len=80 if args.pipeline == 'fixed' else None)
     model.summary()
     
-    print('\nTraining model (optimized for speed)...')
+    print(f'\nTraining model (optimized for speed, {args.pipeline} pipeline)...')
     es = EarlyStopping(monitor='val_loss', patience=2, restore_best_weights=True, verbose=1)
     
-    history = model.fit(
-        X_train, y_train,
-        validation_split=0.1,
+    history, epoch_times = fit_model(
+        model, X_train, y_train,
+        pipeline=args.pipeline,
         epochs=5,
         batch_size=256,
         callbacks=[es],
-        verbose=1
+        min_length=3  # Conv1D kernel size
     )
+    print(f'Epoch times: {", ".join(f"{t:.1f}s" for t in epoch_times)}')
     
     # Evaluate
     print('\n' + '='*60)
     print('EVALUATION RESULTS')
     print('='*60)
     
-    y_pred_prob = model.predict(X_test, verbose=0)
+    # As the app serves it: bucketed models get trimmed batches, like in training
+    y_pred_prob = length_aware_model(model, min_length=3).predict(X_test, verbose=0)
     y_pred = (y_pred_prob > 0.5).astype(int).flatten()
     
     acc = accuracy_score(y_test, y_pred)
@@ -178,6 +222,13 @@ def main():
     
     print('\n' + classification_report(y_test, y_pred, target_names=['Legitimate', 'Phishing']))
     
+    # Lexical feature stage on the raw URLs of the same split, with an ablation
+    print('\nTraining lexical URL feature model...')
+    urls_train, urls_test = split_dataset(urls, y)[:2]
+    start = time.perf_counter()
+    url_tier = train_url_feature_tier(urls_train, y_train)
+    report_url_features(url_tier, urls_train, y_train, urls_test, y_test, y_pred_prob, time.perf_counter() - start)
+    
     # Save
     model_path = MODELS_DIR / 'url_model.h5'
     tokenizer_path = MODELS_DIR / 'tokenizer_url.pkl'
@@ -187,6 +238,13 @@ def main():
     
     print(f'\n✓ Model saved to: {model_path}')
     print(f'✓ Tokenizer saved to: {tokenizer_path}')
+    
+    features_path = MODELS_DIR / 'url_features.joblib'
+    url_tier.save(str(features_path))
+    print(f'✓ URL feature model saved to: {features_path}')
+    
+    # Dynamic-range quantized copy for serving, kept only within the accuracy tolerance
+    quantize_for_serving(model, model_path, 80, X_test, y_test, args.quantize_tolerance)
     print('\n' + '='*60)
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+"""Shared training helpers: tf.data input pipelines and epoch timing"""
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback, EarlyStopping
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import train_test_split
+
+from ml_utils import length_aware_model
+
+PIPELINES = ('fixed', 'bucketed')
+NUM_BUCKETS = 8        # length buckets for the bucketed pipeline
+SHUFFLE_BUFFER = 10000
+
+class EpochTimer(Callback):
+    """Records the wall-clock seconds of every training epoch"""
+    def on_train_begin(self, logs=None):
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self._start)
+
+def split_dataset(X, y):
+    """The trainers' fixed train/test split (stratified 80/20), also used by the benchmarks"""
+    return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+def sequence_lengths(X):
+    """Unpadded lengths of post-padded sequences (token ids are never 0)"""
+    return np.count_nonzero(np.asarray(X), axis=1)
+
+def bucket_boundaries(lengths, num_buckets=NUM_BUCKETS, min_length=1):
+    """Length bucket boundaries at evenly spaced quantiles of the training lengths"""
+    quantiles = np.quantile(lengths, np.linspace(0, 1, num_buckets + 1)[1:-1])
+    boundaries = np.unique(np.maximum(quantiles.astype(int) + 1, min_length + 1))
+    return [int(b) for b in boundaries if b <= lengths.max()]
+
+def bucketed_dataset(X, y, batch_size, boundaries, min_length=1, shuffle=True, seed=42):
+    """
+    tf.data pipeline over post-padded X that strips the padding, groups
+    examples of similar length into buckets and pads each batch only to its
+    longest sequence (at least min_length, e.g. a convolution's kernel size).
+    The stripped examples are cached and batches are prefetched.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((np.asarray(X), np.asarray(y)))
+
+    def strip_padding(x, label):
+        length = tf.maximum(tf.math.count_nonzero(x, dtype=tf.int32), min_length)
+        return x[:length], label
+
+    dataset = dataset.map(strip_padding, num_parallel_calls=tf.data.AUTOTUNE).cache()
+    if shuffle:
+        dataset = dataset.shuffle(SHUFFLE_BUFFER, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.bucket_by_sequence_length(
+        element_length_func=lambda x, label: tf.shape(x)[0],
+        bucket_boundaries=boundaries,
+        bucket_batch_sizes=[batch_size] * (len(boundaries) + 1)
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def fit_model(model, X_train, y_train, pipeline='fixed', batch_size=128, epochs=5,
+              callbacks=(), validation_split=0.1, min_length=1, verbose=1):
+    """
+    Train with the fixed-padding NumPy path or the bucketed tf.data path.
+
+    Both hold out the last validation_split of the training data for
+    validation, as Keras' own validation_split does. Returns
+    (history, per-epoch seconds).
+    """
+    timer = EpochTimer()
+    callbacks = [*callbacks, timer]
+    if pipeline == 'fixed':
+        history = model.fit(
+            X_train, y_train,
+            validation_split=validation_split,
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=callbacks,
+            verbose=verbose
+        )
+        return history, timer.times
+
+    split = int(len(X_train) * (1 - validation_split))
+    X_fit, y_fit = X_train[:split], y_train[:split]
+    boundaries = bucket_boundaries(sequence_lengths(X_fit), min_length=min_length)
+    print(f'Length buckets: {boundaries} (batch padded to its longest sequence)')
+    train_ds = bucketed_dataset(X_fit, y_fit, batch_size, boundaries, min_length=min_length)
+    val_ds = bucketed_dataset(X_train[split:], y_train[split:], batch_size, boundaries,
+                              min_length=min_length, shuffle=False)
+    history = model.fit(train_ds, validation_data=val_ds, epochs=epochs, callbacks=callbacks, verbose=verbose)
+    return history, timer.times
+
+def compare_pipelines(build_model, X_train, y_train, X_test, y_test, batch_size, epochs, maxlen, min_length=1):
+    """
+    Train a fresh model with each pipeline and print epoch time and test
+    accuracy side by side, each model scored the way the app serves it.
+    build_model(input_len) builds an untrained model.
+    """
+    results = {}
+    for pipeline in PIPELINES:
+        print(f'\n--- {pipeline} pipeline ---')
+        tf.keras.utils.set_random_seed(42)
+        model = build_model(maxlen if pipeline == 'fixed' else None)
+        es = EarlyStopping(monitor='val_loss', patience=2, restore_best_weights=True, verbose=1)
+        history, times = fit_model(model, X_train, y_train, pipeline, batch_size, epochs,
+                                   callbacks=[es], min_length=min_length, verbose=2)
+        # Scored as served: length_aware_model trims the bucketed model's batches, as in training
+        serving_model = length_aware_model(model, min_length=min_length)
+        y_pred = (serving_model.predict(X_test, batch_size=512, verbose=0) > 0.5).astype(int).flatten()
+        results[pipeline] = (times, accuracy_score(y_test, y_pred), f1_score(y_test, y_pred, zero_division=0))
+
+    lengths = sequence_lengths(X_train)
+    print('\n' + '='*60)
+    print('INPUT PIPELINE COMPARISON')
+    print('='*60)
+    print(f'Sequence length: mean {lengths.mean():.1f}, median {np.median(lengths):.0f}, padded to {maxlen}')
+    print(f'{"pipeline":<10} {"epochs":>6} {"first epoch":>12} {"mean epoch":>11} {"accuracy":>9} {"F1":>7}')
+    for pipeline, (times, acc, f1) in results.items():
+        # The first epoch includes tracing (and filling the bucketed pipeline's cache)
+        later = times[1:] or times
+        print(f'{pipeline:<10} {len(times):>6} {times[0]:>11.1f}s {np.mean(later):>10.1f}s {acc:>9.4f} {f1:>7.4f}')
+    return results